@@ -0,0 +1,155 @@
+"""
+Logging pipeline benchmark.
+
+Compares the previous setup (a synchronous StreamHandler and multi-line f-strings
+built on every call) with the queue-backed pipeline in text and JSON output:
+
+    python -m benchmarks.bench_logging --records 20000 --write-delay 0.0002
+
+Caller latency is the time the logging call holds the calling thread, which under
+the bot is the event loop. `--write-delay` makes every stream write sleep, to
+emulate a slow terminal or a full pipe.
+"""
+import argparse
+import io
+import logging
+import queue
+import time
+from typing import Dict, List
+from benchmarks.common import format_table, summarize, write_results
+from utils.logger import (
+    BatchingStreamHandler, FlushingQueueListener, JsonLinesFormatter, LazyQueueHandler, log_event
+)
+
+TEXT_FORMAT = logging.Formatter('[%(asctime)s] %(message)s', datefmt='%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+class SlowStream(io.StringIO):
+    """A stream whose writes cost a fixed delay."""
+
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay = delay
+        self.writes = 0
+
+    def write(self, text: str) -> int:
+        self.writes += 1
+        if self.delay:
+            time.sleep(self.delay)
+        # Only the size matters, keeping the text would grow without bound.
+        return len(text)
+
+
+class FakeUser:
+    id = 123456789012345678
+
+    def __str__(self) -> str:
+        return 'raider#0001'
+
+
+def log_legacy(logger: logging.Logger, user, answer: int, correct: int) -> None:
+    logger.info(
+        f'VERIFICATION_ATTEMPT: User {user} (ID: {user.id})\n'
+        f'  Given Answer: {answer}\n'
+        f'  Correct Answer: {correct}\n'
+        f'  Pattern: pattern_3.png'
+    )
+
+
+def log_structured(logger: logging.Logger, user, answer: int, correct: int) -> None:
+    log_event(
+        logger, 'VERIFICATION_ATTEMPT', user=user, user_id=user.id,
+        given=answer, correct=correct, pattern='pattern_3.png'
+    )
+
+
+def build(mode: str, stream: SlowStream):
+    """Returns (logger, log function, listener) for a mode."""
+    logger = logging.getLogger(f'bench_logging.{mode}')
+    logger.handlers.clear()
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    if mode == 'legacy':
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(TEXT_FORMAT)
+        logger.addHandler(handler)
+        return logger, log_legacy, None
+
+    if mode == 'queue_json':
+        handler = BatchingStreamHandler(stream)
+        handler.setFormatter(JsonLinesFormatter())
+    else:
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(TEXT_FORMAT)
+
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(LazyQueueHandler(log_queue))
+    listener = FlushingQueueListener(log_queue, handler)
+    listener.start()
+    return logger, log_structured, listener
+
+
+def bench_mode(mode: str, records: int, write_delay: float, level: int) -> dict:
+    stream = SlowStream(write_delay)
+    logger, log, listener = build(mode, stream)
+    logger.setLevel(level)
+    user = FakeUser()
+    samples: List[float] = []
+
+    started = time.perf_counter()
+    for index in range(records):
+        call_started = time.perf_counter()
+        log(logger, user, index, 42)
+        samples.append(time.perf_counter() - call_started)
+    submitted = time.perf_counter()
+
+    if listener is not None:
+        listener.stop()
+    for handler in logger.handlers:
+        handler.flush()
+    drained = time.perf_counter()
+
+    return dict(
+        summarize(samples),
+        caller_records_per_second=records / (submitted - started),
+        drained_records_per_second=records / (drained - started),
+        stream_writes=stream.writes,
+    )
+
+
+def report(results: Dict[str, dict]) -> str:
+    rows = [['mode', 'level', 'p50 ms', 'p99 ms', 'caller rec/s', 'drained rec/s', 'writes']]
+    for key, result in results.items():
+        mode, level = key.rsplit('@', 1)
+        rows.append([
+            mode, level,
+            f"{result['p50_ms']:.4f}",
+            f"{result['p99_ms']:.4f}",
+            f"{result['caller_records_per_second']:.0f}",
+            f"{result['drained_records_per_second']:.0f}",
+            str(result['stream_writes']),
+        ])
+    return format_table(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=20_000)
+    parser.add_argument('--write-delay', type=float, default=0.0, help='seconds every stream write takes')
+    parser.add_argument('--output', default=None, help='results file, defaults to benchmarks/results/')
+    args = parser.parse_args()
+
+    results = {}
+    for level in (logging.INFO, logging.WARNING):
+        for mode in ('legacy', 'queue_text', 'queue_json'):
+            results[f'{mode}@{logging.getLevelName(level)}'] = bench_mode(
+                mode, args.records, args.write_delay, level
+            )
+
+    print(report(results))
+    print(f"\nResults written to {write_results('logging', results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Member cache memory benchmark.
+
+Replays a GUILD_CREATE and the member chunks that follow it through discord.py's
+connection state, once with the default options and once in low-memory mode, each
+in a fresh process:
+
+    python -m benchmarks.bench_memory --sizes 1000,10000,100000
+
+Startup time is the CPU time spent processing chunks; on a live gateway every chunk
+of 1000 members also costs a round trip before the bot reports ready.
+"""
+import argparse
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+from benchmarks.common import bench_config, current_rss_bytes, format_table, write_results
+
+CHUNK_SIZE = 1000
+GUILD_ID = 1
+MODES = ('default', 'low_memory')
+
+
+def guild_payload(member_count: int) -> dict:
+    return {
+        'id': str(GUILD_ID),
+        'name': 'bench',
+        'owner_id': '1',
+        'member_count': member_count,
+        'large': member_count > 250,
+        'roles': [{
+            'id': str(GUILD_ID), 'name': '@everyone', 'permissions': '0', 'position': 0,
+            'color': 0, 'hoist': False, 'managed': False, 'mentionable': False,
+        }],
+        'channels': [],
+        'members': [],
+        'emojis': [],
+        'stickers': [],
+        'features': [],
+    }
+
+
+def member_payload(member_id: int) -> dict:
+    return {
+        'user': {
+            'id': str(member_id), 'username': f'member{member_id}', 'global_name': None,
+            'discriminator': '0', 'avatar': None,
+        },
+        'roles': [],
+        'joined_at': '2024-01-01T00:00:00+00:00',
+        'deaf': False,
+        'mute': False,
+        'flags': 0,
+    }
+
+
+def replay_startup(mode: str, member_count: int) -> dict:
+    """Runs in a child process so every measurement starts from the same baseline."""
+    import discord
+    from discord.state import ChunkRequest
+    from utils.client_options import client_options
+
+    options = client_options(bench_config(low_memory=mode == 'low_memory'))
+    options.pop('command_prefix')
+    client = discord.Client(**options)
+    state = client._connection
+    rss_before = current_rss_bytes()
+
+    started = time.perf_counter()
+    guild = state._add_guild_from_data(guild_payload(member_count))
+    chunks = 0
+    if state._chunk_guilds:
+        request = ChunkRequest(guild.id, 0, None, state._get_guild, cache=state.member_cache_flags.joined)
+        state._chunk_requests[request.nonce] = request
+        chunks = -(-member_count // CHUNK_SIZE)
+        for index in range(chunks):
+            first = 1000 + index * CHUNK_SIZE
+            state.parse_guild_members_chunk({
+                'guild_id': str(guild.id),
+                'members': [
+                    member_payload(member_id)
+                    for member_id in range(first, min(first + CHUNK_SIZE, 1000 + member_count))
+                ],
+                'chunk_index': index,
+                'chunk_count': chunks,
+                'nonce': request.nonce,
+            })
+        request.buffer.clear()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'mode': mode,
+        'members': member_count,
+        'cached_members': len(guild.members),
+        'chunks': chunks,
+        'process_seconds': elapsed,
+        'rss_growth_bytes': current_rss_bytes() - rss_before,
+    }
+
+
+def report(results: List[dict]) -> str:
+    rows = [['members', 'mode', 'cached', 'chunks', 'process s', 'RSS +MiB']]
+    for result in results:
+        rows.append([
+            str(result['members']),
+            result['mode'],
+            str(result['cached_members']),
+            str(result['chunks']),
+            f"{result['process_seconds']:.3f}",
+            f"{result['rss_growth_bytes'] / 2 ** 20:.1f}",
+        ])
+    return format_table(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=lambda value: [int(v) for v in value.split(',')], default=[1000, 10_000, 100_000])
+    parser.add_argument('--output', default=None, help='results file, defaults to benchmarks/results/')
+    args = parser.parse_args()
+
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for size in args.sizes:
+        for mode in MODES:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                results.append(executor.submit(replay_startup, mode, size).result())
+
+    print(report(results))
+    print(f"\nResults written to {write_results('memory', results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+"""
+Challenge generation pipeline benchmark.
+
+Runs without a Discord connection, from the repository root:
+
+    python -m benchmarks.bench_pipeline --iterations 200 --concurrency 1,4,16
+
+Per-stage latencies are measured serially on the calling thread. End-to-end
+throughput goes through Verification.generate_verification with the challenge
+pool disabled, so every call renders on the configured executor.
+"""
+import argparse
+import asyncio
+import random
+import time
+from typing import Dict, List
+from cogs.verification import Verification
+from benchmarks.common import OfflineBot, bench_config, format_table, peak_rss_bytes, summarize, write_results
+from utils.encoding import ENCODING_PROFILES, ImageEncoder
+from utils.image_generator import ImageGenerator
+
+
+def bench_stages(generator: ImageGenerator, iterations: int) -> Dict[str, dict]:
+    timings: Dict[str, List[float]] = {'problem': [], 'compose': [], 'noise': [], 'encode': [], 'total': []}
+    sizes = []
+
+    for _ in range(iterations):
+        started = time.perf_counter()
+        pattern_file, problem_text, _ = generator.generate_math_problem()
+        generated = time.perf_counter()
+        image = generator.compose_base(pattern_file, problem_text)
+        composed = time.perf_counter()
+        generator.apply_noise(image)
+        noised = time.perf_counter()
+        buffer = generator.encode(image)
+        encoded = time.perf_counter()
+
+        timings['problem'].append(generated - started)
+        timings['compose'].append(composed - generated)
+        timings['noise'].append(noised - composed)
+        timings['encode'].append(encoded - noised)
+        timings['total'].append(encoded - started)
+        sizes.append(len(buffer.getvalue()))
+
+    results = {stage: summarize(samples) for stage, samples in timings.items()}
+    results['bytes_per_image'] = sum(sizes) / len(sizes)
+    return results
+
+
+def bench_profiles(generator: ImageGenerator, iterations: int) -> Dict[str, dict]:
+    """Encodes the same rendered images with every profile."""
+    images = []
+    for _ in range(iterations):
+        pattern_file, problem_text, _ = generator.generate_math_problem()
+        image = generator.compose_base(pattern_file, problem_text)
+        generator.apply_noise(image)
+        images.append(image)
+
+    results = {}
+    for name in ENCODING_PROFILES:
+        encoder = ImageEncoder(name)
+        timings = []
+        for image in images:
+            started = time.perf_counter()
+            encoder.encode(image)
+            timings.append(time.perf_counter() - started)
+        results[name] = dict(summarize(timings), bytes_per_image=encoder.stats()['mean_bytes'])
+    return results
+
+
+def bench_problems(generator: ImageGenerator, count: int, seed: int = None) -> Dict[str, float]:
+    """Problems per second from the per-call generator and from generate_batch."""
+    started = time.perf_counter()
+    for _ in range(count):
+        generator.generate_math_problem()
+    per_call = time.perf_counter() - started
+
+    started = time.perf_counter()
+    generator.generate_batch(count, seed=seed)
+    batch = time.perf_counter() - started
+
+    return {
+        'count': count,
+        'per_call_per_sec': count / per_call,
+        'batch_per_sec': count / batch,
+    }
+
+
+async def bench_end_to_end(cog, iterations: int, concurrency: int) -> dict:
+    latencies: List[float] = []
+    sizes: List[int] = []
+    remaining = iterations
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            result = await cog.generate_verification()
+            latencies.append(time.perf_counter() - started)
+            sizes.append(len(result['image'].getvalue()))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        'concurrency': concurrency,
+        'challenges_per_sec': len(latencies) / elapsed,
+        'latency': summarize(latencies),
+        'bytes_per_image': sum(sizes) / len(sizes),
+        'peak_rss_bytes': peak_rss_bytes(),
+    }
+
+
+async def run(args) -> dict:
+    config = bench_config(
+        render_executor=args.executor,
+        render_workers=args.workers,
+        render_queue_depth=max(args.concurrency) * 2,
+        image_profile=args.profile,
+        pool_low_watermark=0,
+        pool_high_watermark=0,
+        noise_bank_size=args.noise_bank,
+        noise_bank_refresh=0,
+    )
+    cog = Verification(OfflineBot(config))
+    await cog.start_render_pipeline()
+
+    try:
+        problems = bench_problems(cog.image_generator, args.iterations * 100, args.seed)
+        stages = bench_stages(cog.image_generator, args.iterations)
+        profiles = bench_profiles(cog.image_generator, args.iterations)
+        end_to_end = [
+            await bench_end_to_end(cog, args.iterations, concurrency)
+            for concurrency in args.concurrency
+        ]
+    finally:
+        await cog.cog_unload()
+
+    return {
+        'executor': args.executor,
+        'profile': args.profile,
+        'noise_bank': args.noise_bank,
+        'workers': cog.render_executor.workers,
+        'iterations': args.iterations,
+        'problems': problems,
+        'stages': stages,
+        'encoding_profiles': profiles,
+        'end_to_end': end_to_end,
+        'peak_rss_bytes': peak_rss_bytes(),
+    }
+
+
+def report(results: dict) -> str:
+    rows = [['stage', 'p50 ms', 'p95 ms', 'p99 ms']]
+    for stage, summary in results['stages'].items():
+        if isinstance(summary, dict):
+            rows.append([stage] + [f"{summary[key]:.2f}" for key in ('p50_ms', 'p95_ms', 'p99_ms')])
+
+    rows.append(['', '', '', ''])
+    rows.append(['profile', 'p50 ms', 'p95 ms', 'bytes'])
+    for name, summary in results['encoding_profiles'].items():
+        rows.append([name, f"{summary['p50_ms']:.2f}", f"{summary['p95_ms']:.2f}", f"{summary['bytes_per_image']:.0f}"])
+
+    rows.append(['', '', '', ''])
+    rows.append(['concurrency', 'per sec', 'p95 ms', 'p99 ms'])
+    for entry in results['end_to_end']:
+        rows.append([
+            str(entry['concurrency']),
+            f"{entry['challenges_per_sec']:.1f}",
+            f"{entry['latency']['p95_ms']:.2f}",
+            f"{entry['latency']['p99_ms']:.2f}",
+        ])
+    return format_table(rows) + (
+        f"\n\nproblems/s: {results['problems']['per_call_per_sec']:.0f} per call,"
+        f" {results['problems']['batch_per_sec']:.0f} batched"
+        f"\nbytes/image: {results['stages']['bytes_per_image']:.0f}"
+        f"  peak RSS: {results['peak_rss_bytes'] / 2 ** 20:.1f} MiB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--concurrency', type=lambda value: [int(v) for v in value.split(',')], default=[1, 4, 16])
+    parser.add_argument('--executor', choices=('inline', 'thread', 'process'), default='thread')
+    parser.add_argument('--workers', type=int, default=0)
+    parser.add_argument('--noise-bank', type=int, default=0, help='noise bank overlays, 0 draws glyphs per render')
+    parser.add_argument('--profile', choices=tuple(ENCODING_PROFILES), default='png')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--output', default=None, help='results file, defaults to benchmarks/results/')
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    results = asyncio.run(run(args))
+    print(report(results))
+    print(f"\nResults written to {write_results('pipeline', results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
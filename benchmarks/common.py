@@ -0,0 +1,129 @@
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import time
+from typing import Dict, List, Sequence
+from utils.config import Config
+from utils.state_backend import create_state_backend
+from utils.guild_config import GuildConfigIndex
+from utils.expiry_scheduler import ExpiryScheduler
+from utils.metrics import LoopLagMonitor
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+
+def percentile(samples: Sequence[float], fraction: float) -> float:
+    """Nearest-rank percentile, returns 0.0 for an empty sample."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples: Sequence[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds."""
+    return {
+        'count': len(samples),
+        'mean_ms': (sum(samples) / len(samples) * 1000) if samples else 0.0,
+        'p50_ms': percentile(samples, 0.50) * 1000,
+        'p95_ms': percentile(samples, 0.95) * 1000,
+        'p99_ms': percentile(samples, 0.99) * 1000,
+    }
+
+
+def peak_rss_bytes() -> int:
+    """Peak resident set size of this process plus its reaped children."""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    scale = 1 if platform.system() == 'Darwin' else 1024
+    return (own + children) * scale
+
+
+def current_rss_bytes() -> int:
+    """Current resident set size, falling back to the peak where /proc is unavailable."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, ValueError, IndexError):
+        return peak_rss_bytes()
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL,
+            text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def write_results(name: str, results: dict, output: str = None) -> str:
+    """Writes a results document with run metadata and returns its path."""
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{name}-{time.strftime('%Y%m%dT%H%M%S')}.json")
+
+    document = {
+        'benchmark': name,
+        'timestamp': time.time(),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': results,
+    }
+    with open(output, 'w') as f:
+        json.dump(document, f, indent=2)
+    return output
+
+
+def bench_config(**overrides) -> Config:
+    """Config with placeholder Discord settings, good enough to build the cog offline."""
+    values = dict(
+        discord_token='offline',
+        channel_id=0,
+        role_id=0,
+        prefix='!',
+        success_color=0x2B2D31,
+        error_color=15224897,
+        guild_config_path=':memory:',
+    )
+    values.update(overrides)
+    return Config(**values)
+
+
+class OfflineBot:
+    """The parts of CrspyBot the Verification cog touches, without a gateway connection."""
+
+    def __init__(self, config: Config):
+        self.config = config
+        self.started_at = time.perf_counter()
+        self.loop = asyncio.get_running_loop()
+        self.pending_verifications = create_state_backend(config)
+        self.guild_configs = GuildConfigIndex(config, config.guild_config_path, capacity=config.guild_config_cache_size)
+        self.expiry_scheduler = ExpiryScheduler(edits_per_second=config.expiry_edits_per_second)
+        self.loop_lag = LoopLagMonitor()
+        self._ready = asyncio.Event()
+
+    def uptime(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    async def wait_until_ready(self):
+        await self._ready.wait()
+
+    def add_view(self, view, message_id=None):
+        pass
+
+    def get_channel(self, channel_id):
+        return None
+
+
+def format_table(rows: List[List[str]]) -> str:
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return '\n'.join('  '.join(cell.ljust(width) for cell, width in zip(row, widths)) for row in rows)
@@ -0,0 +1,112 @@
+"""
+Stand-ins for the discord.py objects the views touch. Every API call is recorded
+instead of sent, after an optional simulated round trip.
+"""
+import asyncio
+import collections
+import datetime
+from typing import Dict, List, Optional, Tuple
+import discord
+
+
+class CallLog:
+    """Counts API calls by kind and responses by title and description."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: collections.Counter = collections.Counter()
+        self.responses: collections.Counter = collections.Counter()
+
+    async def call(self, kind: str, embed: Optional[discord.Embed] = None) -> None:
+        self.calls[kind] += 1
+        if embed is not None:
+            self.responses[f'{embed.title}: {(embed.description or "")[:48]}'] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+
+class FakeRole:
+    def __init__(self, role_id: int, guild: 'FakeGuild'):
+        self.id = role_id
+        self.guild = guild
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, role_ids: Tuple[int, ...] = ()):
+        self.id = guild_id
+        self.roles: Dict[int, FakeRole] = {role_id: FakeRole(role_id, self) for role_id in role_ids}
+
+    def get_role(self, role_id: int) -> Optional[FakeRole]:
+        return self.roles.get(role_id)
+
+
+class FakeMember:
+    def __init__(self, member_id: int, guild: FakeGuild, log: CallLog):
+        self.id = member_id
+        self.guild = guild
+        self.log = log
+        self.roles: List[FakeRole] = []
+
+    def __str__(self) -> str:
+        return f'loadtest#{self.id % 10000:04d}'
+
+    def get_role(self, role_id: int) -> Optional[FakeRole]:
+        return next((role for role in self.roles if role.id == role_id), None)
+
+    async def add_roles(self, *roles: FakeRole, reason: Optional[str] = None) -> None:
+        await self.log.call('add_roles')
+        self.roles.extend(role for role in roles if role not in self.roles)
+
+
+class FakeResponse:
+    def __init__(self, interaction: 'FakeInteraction'):
+        self.interaction = interaction
+        self.done = False
+
+    def is_done(self) -> bool:
+        return self.done
+
+    def _acknowledge(self) -> None:
+        if self.done:
+            raise discord.InteractionResponded(self.interaction)
+        self.done = True
+
+    async def defer(self, ephemeral: bool = False, thinking: bool = False) -> None:
+        self._acknowledge()
+        await self.interaction.log.call('defer')
+
+    async def send_message(self, embed: Optional[discord.Embed] = None, **kwargs) -> None:
+        self._acknowledge()
+        await self.interaction.log.call('send_message', embed)
+
+    async def send_modal(self, modal: discord.ui.Modal) -> None:
+        self._acknowledge()
+        self.interaction.modal = modal
+        await self.interaction.log.call('send_modal')
+
+
+class FakeFollowup:
+    def __init__(self, interaction: 'FakeInteraction'):
+        self.interaction = interaction
+
+    async def send(self, embed: Optional[discord.Embed] = None, **kwargs) -> None:
+        await self.interaction.log.call('followup_send', embed)
+
+
+class FakeInteraction:
+    """One button click or modal submit by `user`."""
+
+    def __init__(self, user: FakeMember, log: CallLog):
+        self.user = user
+        self.guild = user.guild
+        self.guild_id = user.guild.id
+        self.application_id = 1
+        self.token = f'loadtest-{user.id}'
+        self.log = log
+        self.created_at = datetime.datetime.now(datetime.timezone.utc)
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.modal: Optional[discord.ui.Modal] = None
+
+    async def edit_original_response(self, embed: Optional[discord.Embed] = None, **kwargs) -> None:
+        await self.log.call('edit_original_response', embed)
@@ -0,0 +1,210 @@
+"""
+Offline load test of the verification flow.
+
+Drives the real VerifyButton, SubmitAnswerButton and AnswerModal callbacks with fake
+members and interactions, without a network connection:
+
+    python -m benchmarks.loadtest --scenario raid --users 2000 --ramp 2
+
+Scenarios:
+    raid       every user clicks Verify within the ramp and answers correctly
+    abandon    users request a challenge and never answer
+    wrong      users answer wrong twice before answering correctly
+    bypass     users try the bypass code, half of them with someone else's id
+"""
+import argparse
+import asyncio
+import collections
+import logging
+import random
+import time
+from typing import Dict, List
+from benchmarks.common import (
+    OfflineBot, bench_config, current_rss_bytes, format_table, percentile, summarize, write_results
+)
+from benchmarks.fakes import CallLog, FakeGuild, FakeInteraction, FakeMember
+from cogs.verification import Verification
+from utils.guild_config import GuildSettings
+from views.verify_button import SubmitAnswerButton, VerifyButton
+
+SCENARIOS = ('raid', 'abandon', 'wrong', 'bypass')
+GUILD_ID = 1
+ROLE_ID = 2
+FIRST_USER_ID = 10 ** 17
+
+
+class LoadTest:
+    def __init__(self, cog: Verification, log: CallLog):
+        self.cog = cog
+        self.log = log
+        self.guild = FakeGuild(GUILD_ID, (ROLE_ID,))
+        self.verify_button = VerifyButton(cog)
+        self.submit_button = SubmitAnswerButton(cog)
+        self.latencies: Dict[str, List[float]] = collections.defaultdict(list)
+        self.flows = 0
+
+    async def timed(self, stage: str, coroutine) -> None:
+        started = time.perf_counter()
+        await coroutine
+        self.latencies[stage].append(time.perf_counter() - started)
+
+    async def click_verify(self, member: FakeMember) -> bool:
+        """Returns True when the member ended up with a challenge."""
+        await self.timed('verify', self.verify_button.callback(FakeInteraction(member, self.log)))
+        return await self.cog.bot.pending_verifications.get(GUILD_ID, member.id) is not None
+
+    async def submit(self, member: FakeMember, answer: str) -> None:
+        interaction = FakeInteraction(member, self.log)
+        await self.timed('open_modal', self.submit_button.callback(interaction))
+        if interaction.modal is None:
+            return
+
+        modal = interaction.modal
+        modal.answer._value = answer
+        await self.timed('submit', modal.on_submit(FakeInteraction(member, self.log)))
+
+    async def user(self, scenario: str, member: FakeMember, delay: float) -> None:
+        await asyncio.sleep(delay)
+        if not await self.click_verify(member):
+            return
+
+        answer = (await self.cog.bot.pending_verifications.get(GUILD_ID, member.id)).answer
+        if scenario == 'raid':
+            await self.submit(member, str(answer))
+        elif scenario == 'wrong':
+            for _ in range(2):
+                await self.submit(member, str(answer + 1))
+            await self.submit(member, str(answer))
+        elif scenario == 'bypass':
+            claimed = member.id if member.id % 2 else member.id + 1
+            await self.submit(member, f"{claimed}'s verification code")
+        self.flows += 1
+
+
+async def sample_loop_lag(samples: List[float], interval: float = 0.01) -> None:
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - started - interval))
+
+
+async def run_scenario(args, scenario: str) -> dict:
+    config = bench_config(
+        render_executor=args.executor,
+        render_workers=args.workers,
+        role_id=ROLE_ID,
+        role_grant_rate=args.role_grant_rate,
+        role_grant_burst=max(1, int(args.role_grant_rate)),
+        noise_bank_refresh=0,
+        adaptive_quality=not args.fixed_quality,
+    )
+    bot = OfflineBot(config)
+    log = CallLog(latency=args.api_latency)
+    await bot.guild_configs.set(GuildSettings(GUILD_ID, 0, ROLE_ID, config.success_color, config.error_color))
+    cog = Verification(bot)
+    await cog.start_render_pipeline()
+    bot.expiry_scheduler.start()
+    bot.loop_lag.start()
+    if args.warm:
+        while len(cog.challenge_pool) < config.pool_high_watermark:
+            await asyncio.sleep(0.05)
+
+    test = LoadTest(cog, log)
+    members = [FakeMember(FIRST_USER_ID + index, test.guild, log) for index in range(args.users)]
+    lag: List[float] = []
+    lag_task = asyncio.get_running_loop().create_task(sample_loop_lag(lag))
+    rss_before = current_rss_bytes()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        test.user(scenario, member, random.uniform(0, args.ramp))
+        for member in members
+    ))
+    elapsed = time.perf_counter() - started
+    rss_after = current_rss_bytes()
+
+    lag_task.cancel()
+    bot.expiry_scheduler.stop()
+    bot.loop_lag.stop()
+    await cog.cog_unload()
+    await bot.pending_verifications.close()
+    await bot.guild_configs.close()
+
+    return {
+        'scenario': scenario,
+        'users': args.users,
+        'seconds': elapsed,
+        'flows_per_sec': test.flows / elapsed,
+        'completed_flows': test.flows,
+        'latency': {stage: summarize(samples) for stage, samples in test.latencies.items()},
+        'loop_lag_ms': {
+            'p50': percentile(lag, 0.50) * 1000,
+            'p99': percentile(lag, 0.99) * 1000,
+            'max': max(lag, default=0.0) * 1000,
+        },
+        'rss_growth_bytes': rss_after - rss_before,
+        'pending_after': len(bot.pending_verifications),
+        'expiry_scheduled': len(bot.expiry_scheduler),
+        'api_calls': dict(log.calls),
+        'responses': dict(log.responses.most_common()),
+        'admission': cog.admission.stats(),
+        'pool': cog.challenge_pool.stats(),
+        'role_grants': cog.role_dispatcher.stats(),
+        'quality': cog.quality.stats(),
+    }
+
+
+def report(results: List[dict]) -> str:
+    rows = [['scenario', 'flows/s', 'verify p50', 'verify p99', 'submit p99', 'lag p99', 'lag max', 'RSS +MiB']]
+    for result in results:
+        latency = result['latency']
+        rows.append([
+            result['scenario'],
+            f"{result['flows_per_sec']:.1f}",
+            f"{latency.get('verify', {}).get('p50_ms', 0.0):.1f}",
+            f"{latency.get('verify', {}).get('p99_ms', 0.0):.1f}",
+            f"{latency.get('submit', {}).get('p99_ms', 0.0):.1f}",
+            f"{result['loop_lag_ms']['p99']:.1f}",
+            f"{result['loop_lag_ms']['max']:.1f}",
+            f"{result['rss_growth_bytes'] / 2 ** 20:.1f}",
+        ])
+
+    lines = [format_table(rows)]
+    for result in results:
+        lines.append(f"\n{result['scenario']}: {result['completed_flows']}/{result['users']} flows completed, "
+                     f"{result['pending_after']} pending, admission {result['admission']}, "
+                     f"quality {result['quality']}")
+        for response, count in result['responses'].items():
+            lines.append(f"  {count:>6}  {response}")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', choices=SCENARIOS + ('all',), default='all')
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--ramp', type=float, default=1.0, help='seconds over which users arrive')
+    parser.add_argument('--api-latency', type=float, default=0.02, help='simulated Discord round trip')
+    parser.add_argument('--executor', choices=('inline', 'thread', 'process'), default='thread')
+    parser.add_argument('--workers', type=int, default=0)
+    parser.add_argument('--role-grant-rate', type=float, default=50.0)
+    parser.add_argument('--fixed-quality', action='store_true', help='always render at full quality')
+    parser.add_argument('--warm', action='store_true', help='wait for the challenge pool to fill first')
+    parser.add_argument('--log-level', default='ERROR', help='captcha_bot log level, records go to stderr')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--output', default=None, help='results file, defaults to benchmarks/results/')
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    logging.basicConfig(format='%(message)s')
+    logging.getLogger('captcha_bot').setLevel(args.log_level)
+
+    scenarios = SCENARIOS if args.scenario == 'all' else (args.scenario,)
+    results = [asyncio.run(run_scenario(args, scenario)) for scenario in scenarios]
+    print(report(results))
+    print(f"\nResults written to {write_results('loadtest', {'runs': results}, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
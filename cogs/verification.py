@@ -1,65 +1,318 @@
+import asyncio
+import datetime
+import io
+import time
+from typing import List, Optional, Tuple
 import discord
 from discord.ext import commands
 from discord.ui import View
 import logging
 from utils.image_generator import ImageGenerator
-from views.verify_button import PersistentView
+from utils.noise_bank import NoiseBank
+from utils.render_executor import RenderExecutor
+from utils.challenge_pool import ChallengePool, PooledChallenge
+from utils.role_dispatcher import RoleGrantDispatcher
+from utils.admission import Admission, AdmissionController
+from utils.metrics import metrics
+from utils.quality import QualityController
+from utils.profiling import PROFILE_KINDS, profiler
+from utils.guild_config import DEFAULT_DIFFICULTY, DIFFICULTIES, GuildSettings
+from views.verify_button import PersistentView, SubmitAnswerView
 from utils.models import VerificationData
 
 logger = logging.getLogger('captcha_bot')
 
+# Discord only bulk deletes messages younger than two weeks.
+BULK_DELETE_MAX_AGE = datetime.timedelta(days=14)
+
+
 class Verification(commands.Cog):
-    def __init__(self, bot):
+    def __init__(self, bot, image_generator: Optional[ImageGenerator] = None):
         self.bot = bot
-        self.image_generator = ImageGenerator()
-        self.bot.loop.create_task(self.setup_verification_message())
+        self.image_generator = image_generator or ImageGenerator(
+            self.bot.config.image_profile, pattern_atlas=self.bot.config.pattern_atlas_path
+        )
+        self.noise_bank = None
+        self.noise_bank_task = None
+        if self.bot.config.noise_bank_size:
+            self.noise_bank = NoiseBank(self.bot.config.noise_bank_path, self.bot.config.noise_bank_size)
+            self.image_generator.noise_bank = self.noise_bank
+        self.challenge_view = SubmitAnswerView.detached(self)
+        self.expired_view = SubmitAnswerView.detached(self, disabled=True)
+        self.render_executor = RenderExecutor(
+            self.image_generator,
+            mode=self.bot.config.render_executor,
+            workers=self.bot.config.render_workers,
+            queue_depth=self.bot.config.render_queue_depth,
+            timeout=self.bot.config.render_timeout,
+        )
+        self.challenge_pool = ChallengePool(
+            self.render_pooled_challenge,
+            low_watermark=self.bot.config.pool_low_watermark,
+            high_watermark=self.bot.config.pool_high_watermark,
+            max_parallel=self.render_executor.workers,
+        )
+        self.admission = AdmissionController(
+            cooldown=self.bot.config.verify_cooldown,
+            max_concurrent=self.bot.config.max_concurrent_renders,
+            backlog_threshold=self.bot.config.render_backlog_threshold,
+        )
+        self.role_dispatcher = RoleGrantDispatcher(
+            rate=self.bot.config.role_grant_rate,
+            burst=self.bot.config.role_grant_burst,
+        )
+        self.role_dispatcher.start()
+        self.quality = QualityController(
+            queue_depth=lambda: self.render_executor.pending,
+            loop_lag=lambda: self.bot.loop_lag.last_lag,
+            queue_threshold=self.bot.config.quality_queue_threshold,
+            latency_threshold=self.bot.config.quality_latency_threshold,
+            lag_threshold=self.bot.config.quality_lag_threshold,
+            hold=self.bot.config.quality_hold,
+            enabled=self.bot.config.adaptive_quality,
+            on_change=self.quality_changed,
+        )
+        self.generate_seconds = metrics.histogram(
+            'verification_generate_seconds', 'Time to produce a challenge for a Verify click'
+        )
+        profiler.sample_rate = self.bot.config.profile_sample_rate
+        profiler.directory = self.bot.config.profile_dir
+        profiler.slow_callback = self.bot.config.profile_slow_callback
+        self.profile_task = None
+        self.startup_logged = False
+        self.register_metrics()
+        self.bot.loop.create_task(self.start_render_pipeline())
+        self.bot.loop.create_task(self.setup_verification_messages())
+
+    def register_metrics(self):
+        metrics.gauge('challenge_pool_size', 'Ready challenges in the pool', callback=lambda: len(self.challenge_pool))
+        for outcome in ('hits', 'misses'):
+            metrics.gauge(
+                'challenge_pool_takes', 'Pool takes by outcome', {'outcome': outcome},
+                callback=lambda outcome=outcome: getattr(self.challenge_pool, outcome)
+            )
+        for decision in Admission:
+            metrics.gauge(
+                'admission_decisions', 'Verify clicks by admission decision', {'decision': decision.value},
+                callback=lambda decision=decision: self.admission.counts[decision]
+            )
+
+    async def start_render_pipeline(self):
+        """Prepares the noise bank and warms the render workers, then starts filling the challenge pool."""
+        if self.noise_bank is not None:
+            try:
+                await asyncio.to_thread(
+                    self.noise_bank.ensure, self.image_generator.noise_renderer, self.bot.config.noise_bank_refresh
+                )
+            except OSError as e:
+                logger.error(f"Error preparing noise bank, falling back to per-render noise: {e}")
+            if self.bot.config.noise_bank_refresh:
+                self.noise_bank_task = self.bot.loop.create_task(self.refresh_noise_bank())
+        await self.render_executor.start()
+        self.quality.start()
+        self.challenge_pool.start()
+
+    async def refresh_noise_bank(self):
+        """Regenerates the noise overlays every NOISE_BANK_REFRESH seconds."""
+        while True:
+            await asyncio.sleep(self.bot.config.noise_bank_refresh)
+            try:
+                await asyncio.to_thread(self.noise_bank.build, self.image_generator.noise_renderer)
+            except OSError as e:
+                logger.error(f"Error refreshing noise bank: {e}")
+
+    async def cog_unload(self):
+        if self.noise_bank_task is not None:
+            self.noise_bank_task.cancel()
+        if self.profile_task is not None:
+            self.profile_task.cancel()
+            await profiler.stop()
+        self.role_dispatcher.stop()
+        self.quality.stop()
+        self.challenge_pool.stop()
+        self.render_executor.shutdown()
+
+    def is_verification_message(self, message: discord.Message) -> bool:
+        """True for a message this bot sent with the Verify button on it."""
+        if message.author.id != self.bot.user.id:
+            return False
+        return any(
+            getattr(component, 'custom_id', None) == 'verify_button'
+            for row in message.components
+            for component in getattr(row, 'children', ())
+        )
+
+    async def bulk_delete(self, channel, messages: List[discord.Message]):
+        """Deletes messages in batches of 100, falling back to single deletes for old messages."""
+        cutoff = discord.utils.utcnow() - BULK_DELETE_MAX_AGE
+        recent = [message for message in messages if message.created_at > cutoff]
+        old = [message for message in messages if message.created_at <= cutoff]
+
+        for start in range(0, len(recent), 100):
+            batch = recent[start:start + 100]
+            if len(batch) == 1:
+                old.extend(batch)
+            else:
+                await channel.delete_messages(batch)
+        for message in old:
+            await message.delete()
+
+    async def guild_settings(self, guild_id: Optional[int]) -> Optional[GuildSettings]:
+        """A guild's settings, or None when verification is not configured there."""
+        return await self.bot.guild_configs.get(guild_id)
 
-    async def setup_verification_message(self):
-        """Sets up the verification message in the designated channel."""
+    async def display_settings(self, guild_id: Optional[int]) -> GuildSettings:
+        """Settings to style a reply with, configured or not. Never use these to act on a guild."""
+        settings = await self.guild_settings(guild_id)
+        return settings or GuildSettings.unconfigured(guild_id or 0, self.bot.config)
+
+    def not_configured_embed(self) -> discord.Embed:
+        return discord.Embed(
+            title="Error",
+            description="Verification is not configured in this server.",
+            color=self.bot.config.error_color
+        )
+
+    async def setup_verification_messages(self):
+        """Registers the persistent views and sets up every configured guild concurrently."""
         await self.bot.wait_until_ready()
 
         self.bot.add_view(PersistentView(self))
+        self.bot.add_view(SubmitAnswerView(self))
 
+        guilds = {settings.guild_id: settings for settings in await self.bot.guild_configs.configured()}
         channel = self.bot.get_channel(self.bot.config.channel_id)
+        if channel is not None and channel.guild.id not in guilds:
+            guilds[channel.guild.id] = GuildSettings.from_config(channel.guild.id, self.bot.config)
+        elif channel is None and not guilds:
+            await self.setup_verification_message(GuildSettings.from_config(0, self.bot.config))
+
+        await asyncio.gather(*(self.setup_verification_message(settings) for settings in guilds.values()))
+        if not self.startup_logged:
+            self.startup_logged = True
+            logger.info(f"Verification ready in {len(guilds)} guilds {self.bot.uptime():.2f}s after start")
+
+    async def setup_verification_message(self, settings: GuildSettings):
+        """
+        Sets up the verification message in a guild's verification channel.
+        In `reuse` mode the bot's existing verification message is edited in place and
+        everything else is bulk deleted; `recreate` clears the channel and sends a new one.
+        """
+        channel = self.bot.get_channel(settings.channel_id)
+        if not channel and self.bot.config.shard_ids is not None:
+            # With several processes only the one holding the channel's shard sets it up.
+            logger.info(f"Channel {settings.channel_id} is not on shards {self.bot.config.shard_ids}")
+            return
         if not channel:
-            logger.error(f"Could not find channel with ID {self.bot.config.channel_id}")
+            logger.error(f"Could not find channel with ID {settings.channel_id}")
+            return
+        if channel.guild.id != settings.guild_id:
+            # Never clear another guild's channel on behalf of this one.
+            logger.error(f"Channel {settings.channel_id} does not belong to guild {settings.guild_id}")
             return
 
+        existing = None
         try:
-            async for message in channel.history(limit=100):
-                await message.delete()
+            messages = [message async for message in channel.history(limit=100)]
+            if self.bot.config.verification_message_mode == 'reuse':
+                existing = next((message for message in messages if self.is_verification_message(message)), None)
+            await self.bulk_delete(channel, [message for message in messages if message is not existing])
         except Exception as e:
             logger.error(f"Error clearing channel: {e}")
 
         embed = discord.Embed(
             title="<:locked:1330487709243801600> ` Verification Required! `",
-            description="<:new:1119328501846265928> Welcome to ` Crspy's Server `! To access the full server, you need to pass our verification first.\n"
+            description=f"<:new:1119328501846265928> Welcome to ` {channel.guild.name} `! To access the full server, you need to pass our verification first.\n"
                         "<:space:1330490770188140681> <:add:1330488764593606696> Click on the **Verify** button below to start.",
-            color=self.bot.config.success_color
+            color=settings.success_color
         )
 
         try:
-            await channel.send(embed=embed, view=PersistentView(self))
-            logger.info("Verification message sent to channel")
+            if existing is not None:
+                await existing.edit(embed=embed, view=PersistentView(self))
+                logger.info(f"Verification message updated in place in guild {channel.guild.id}")
+            else:
+                await channel.send(embed=embed, view=PersistentView(self))
+                logger.info(f"Verification message sent to channel in guild {channel.guild.id}")
         except Exception as e:
             logger.error(f"Error sending verification message: {e}")
 
-    async def generate_verification(self):
-        """Generates a new verification problem."""
+    async def render_challenge(self, difficulty: int = DEFAULT_DIFFICULTY) -> PooledChallenge:
+        """Generates and renders a single challenge at the current quality tier."""
+        if difficulty == DEFAULT_DIFFICULTY:
+            pattern_file, problem_text, answer = self.image_generator.next_problem()
+        else:
+            pattern_file, problem_text, answer = self.image_generator.generate_math_problem(difficulty)
+        level, tier = self.quality.level, self.quality.tier
+        started = time.perf_counter()
+        image_buffer = await self.render_executor.render(pattern_file, problem_text, tier)
+        self.quality.observe_render(time.perf_counter() - started)
+
+        verification_data = VerificationData(
+            answer=answer,
+            pattern_file=pattern_file,
+            polynomial=problem_text,
+            attempts=0
+        )
+        return PooledChallenge(
+            verification=verification_data,
+            image=image_buffer.getvalue(),
+            filename=self.image_generator.encoder_for(tier.encoding_profile).filename,
+            level=level,
+        )
+
+    async def render_pooled_challenge(self) -> PooledChallenge:
+        """Renders a challenge for the pool, again if quality recovered while it was rendering."""
+        challenge = await self.render_challenge()
+        while challenge.level > self.quality.level:
+            challenge = await self.render_challenge()
+        return challenge
+
+    def quality_changed(self, previous: int, level: int) -> None:
+        """Once quality recovers, challenges rendered at a lower quality leave the pool."""
+        if level < previous:
+            dropped = self.challenge_pool.discard(lambda challenge: challenge.level > level)
+            if dropped:
+                logger.info(f"Dropped {dropped} pooled challenges rendered below the {self.quality.tier.name} tier")
+
+    async def rerender_verification(self, verification: VerificationData) -> Tuple[io.BytesIO, str]:
+        """Renders a pending challenge's problem again, returning the image and its filename."""
+        tier = self.quality.tier
+        started = time.perf_counter()
+        with self.admission.track():
+            image = await self.render_executor.render(verification.pattern_file, verification.polynomial, tier)
+        self.quality.observe_render(time.perf_counter() - started)
+        return image, self.image_generator.encoder_for(tier.encoding_profile).filename
+
+    def has_ready_challenge(self, difficulty: int = DEFAULT_DIFFICULTY) -> bool:
+        """The pool only holds challenges at the default difficulty."""
+        return difficulty == DEFAULT_DIFFICULTY and len(self.challenge_pool) > 0
+
+    async def admit(self, guild_id: int, user_id: int, difficulty: int = DEFAULT_DIFFICULTY) -> Admission:
+        """Admission control in front of generate_verification."""
+        has_pending = await self.bot.pending_verifications.get(guild_id, user_id) is not None
+        return self.admission.check(
+            (guild_id, user_id),
+            has_pending=has_pending,
+            needs_render=not self.has_ready_challenge(difficulty),
+            backlog=self.render_executor.pending,
+        )
+
+    async def generate_verification(self, difficulty: int = DEFAULT_DIFFICULTY):
+        """
+        Takes a ready verification problem from the pool, or generates one when the pool
+        is empty or the guild asks for another difficulty.
+        """
         try:
-            pattern_file, problem_text, answer = self.image_generator.generate_math_problem()
-            image_buffer = await self.image_generator.create_problem_image(pattern_file, problem_text)
-
-            verification_data = VerificationData(
-                answer=answer,
-                pattern_file=pattern_file,
-                polynomial=problem_text,
-                attempts=0
-            )
+            with self.admission.track(), self.generate_seconds.time():
+                challenge = self.challenge_pool.take() if difficulty == DEFAULT_DIFFICULTY else None
+                if challenge is None:
+                    challenge = await self.render_challenge(difficulty)
 
             return {
-                'verification': verification_data,
-                'image': image_buffer
+                'verification': challenge.verification,
+                'image': io.BytesIO(challenge.image),
+                'filename': challenge.filename
             }
         except Exception as e:
             logger.error(f"Error generating verification: {e}")
@@ -69,16 +322,173 @@ class Verification(commands.Cog):
     @commands.has_permissions(administrator=True)
     async def resetverification(self, ctx):
         """Admin command to reset the verification message."""
-        await self.setup_verification_message()
+        settings = await self.guild_settings(ctx.guild.id)
+        if settings is None:
+            await ctx.send(embed=self.not_configured_embed(), delete_after=10)
+            return
+        await self.setup_verification_message(settings)
 
         embed = discord.Embed(
             title="Error",
             description="Verification message has been reset.",
-            color=self.bot.config.error_color
+            color=settings.error_color
+        )
+        await ctx.send(embed=embed, delete_after=5)
+        await ctx.message.delete()
+
+    @commands.command(name='metrics')
+    @commands.is_owner()
+    async def show_metrics(self, ctx):
+        """Owner command to show a summary of the process-wide verification metrics."""
+        settings = await self.display_settings(ctx.guild.id)
+        embed = discord.Embed(title="Verification Metrics", color=settings.success_color)
+
+        latencies = []
+        for name, (kind, _, series) in sorted(metrics.families().items()):
+            if kind != 'histogram' or not name.endswith('_seconds'):
+                continue
+            for key, histogram in series.items():
+                if histogram.count:
+                    label = name + ''.join(f' {value}' for _, value in key)
+                    latencies.append(
+                        f"`{label}` n={histogram.count} "
+                        f"p50≤{histogram.quantile(0.5) * 1000:g}ms p95≤{histogram.quantile(0.95) * 1000:g}ms"
+                    )
+        embed.add_field(name="Latency", value='\n'.join(latencies)[:1024] or "No samples yet.", inline=False)
+
+        embed.add_field(
+            name="Pipeline",
+            value=f"Pool: {self.challenge_pool.stats()}\n"
+                  f"Admission: {self.admission.stats()}\n"
+                  f"Role grants: {self.role_dispatcher.stats()}\n"
+                  f"Quality: {self.quality.stats()}\n"
+                  f"Pending: {self.bot.pending_verifications.stats()}\n"
+                  f"Encoding: {self.render_executor.encoding_stats()}\n"
+                  f"Noise bank: {self.noise_bank.stats() if self.noise_bank else 'disabled'}\n"
+                  f"Guild configs: {self.bot.guild_configs.stats()}",
+            inline=False
+        )
+        await ctx.send(embed=embed)
+
+    @commands.command()
+    @commands.is_owner()
+    async def reloadpatterns(self, ctx):
+        """Owner command to reload the pattern cache after the img directory changes."""
+        cache = self.image_generator.pattern_cache
+        stale = await asyncio.to_thread(cache.is_stale)
+        await asyncio.to_thread(self.image_generator.reload)
+        # Process workers hold their own copy of the patterns.
+        await self.render_executor.recycle()
+        settings = await self.display_settings(ctx.guild.id)
+
+        embed = discord.Embed(
+            title="Patterns Reloaded",
+            description=f"Loaded {len(cache.tiles)} patterns ({cache.memory_usage() // 1024} KiB)."
+                        + ("" if stale else " No changes were detected on disk."),
+            color=settings.success_color
         )
         await ctx.send(embed=embed, delete_after=5)
         await ctx.message.delete()
 
+    @commands.command()
+    @commands.has_permissions(administrator=True)
+    async def setverification(
+        self,
+        ctx,
+        channel: discord.TextChannel,
+        role: discord.Role,
+        difficulty: int = DEFAULT_DIFFICULTY,
+        success_color: Optional[str] = None,
+        error_color: Optional[str] = None,
+    ):
+        """Admin command to set this server's verification channel, role, difficulty and colors."""
+        current = await self.display_settings(ctx.guild.id)
+        try:
+            if difficulty not in DIFFICULTIES:
+                raise ValueError(f"difficulty must be one of {', '.join(map(str, DIFFICULTIES))}")
+            settings = GuildSettings(
+                guild_id=ctx.guild.id,
+                channel_id=channel.id,
+                role_id=role.id,
+                success_color=int(success_color, 0) if success_color else current.success_color,
+                error_color=int(error_color, 0) if error_color else current.error_color,
+                difficulty=difficulty,
+            )
+        except ValueError as e:
+            embed = discord.Embed(title="Error", description=f"Invalid setting: {e}", color=current.error_color)
+            await ctx.send(embed=embed, delete_after=10)
+            return
+
+        await self.bot.guild_configs.set(settings)
+        await self.setup_verification_message(settings)
+
+        embed = discord.Embed(
+            title="Verification Configured",
+            description=f"Verification now runs in {channel.mention}, grants {role.mention} "
+                        f"and asks for up to order-{difficulty} derivatives.",
+            color=settings.success_color
+        )
+        await ctx.send(embed=embed, delete_after=10)
+
+    @commands.command()
+    @commands.is_owner()
+    async def profile(self, ctx, seconds: int = 30, *kinds: str):
+        """Owner command to profile the bot for a fixed window. Kinds are cpu, memory and loop, all by default."""
+        settings = await self.display_settings(ctx.guild.id)
+        try:
+            session = profiler.start(kinds or PROFILE_KINDS, seconds)
+        except (RuntimeError, ValueError) as e:
+            embed = discord.Embed(title="Error", description=str(e), color=settings.error_color)
+            await ctx.send(embed=embed, delete_after=10)
+            return
+
+        self.profile_task = self.bot.loop.create_task(self.finish_profile(ctx.channel, settings, session.seconds))
+        embed = discord.Embed(
+            title="Profiling Started",
+            description=f"Profiling {', '.join(session.kinds)} for {session.seconds:g}s. "
+                        f"Reports will be written to `{profiler.directory}`.",
+            color=settings.success_color
+        )
+        await ctx.send(embed=embed)
+
+    @commands.command()
+    @commands.is_owner()
+    async def stopprofile(self, ctx):
+        """Owner command to end a profiling window early."""
+        settings = await self.display_settings(ctx.guild.id)
+        if self.profile_task is None:
+            embed = discord.Embed(title="Error", description="No profiling session is running.", color=settings.error_color)
+            await ctx.send(embed=embed, delete_after=10)
+            return
+
+        self.profile_task.cancel()
+        self.profile_task = None
+        await self.report_profile(ctx.channel, settings)
+
+    async def finish_profile(self, channel, settings: GuildSettings, seconds: float):
+        await asyncio.sleep(seconds)
+        self.profile_task = None
+        await self.report_profile(channel, settings)
+
+    async def report_profile(self, channel, settings: GuildSettings):
+        """Stops the profiling session and posts where its reports went."""
+        try:
+            paths = await profiler.stop()
+        except OSError as e:
+            logger.error(f"Error writing profiling reports: {e}")
+            embed = discord.Embed(title="Error", description=f"Could not write the reports: {e}", color=settings.error_color)
+        else:
+            embed = discord.Embed(
+                title="Profiling Finished",
+                description='\n'.join(f"`{path}`" for path in paths),
+                color=settings.success_color
+            )
+        await channel.send(embed=embed)
+
 
 async def setup(bot):
-    await bot.add_cog(Verification(bot))
\ No newline at end of file
+    # Decoding the patterns happens off the event loop, alongside the rest of startup.
+    image_generator = await asyncio.to_thread(
+        ImageGenerator, bot.config.image_profile, pattern_atlas=bot.config.pattern_atlas_path
+    )
+    await bot.add_cog(Verification(bot, image_generator))
\ No newline at end of file
@@ -1,52 +1,124 @@
 import discord
 from discord.ext import commands
 import asyncio
+import time
 from utils.logger import setup_logger
 from utils.config import Config, ConfigError
+from utils.client_options import client_options
+from utils.state_backend import create_state_backend
+from utils.guild_config import GuildConfigIndex
+from utils.expiry_scheduler import ExpiryScheduler
+from utils.shard_stats import ShardStats
+from utils.metrics import LoopLagMonitor, MetricsServer, metrics
+from utils.event_loop import run
 import sys
 import os
+from typing import Optional
 
 logger = setup_logger()
 
 
-class CrspyBot(commands.Bot):
-    def __init__(self):
-        # Load configuration
-        try:
-            self.config = Config.load()
-        except ConfigError as e:
-            logger.error(f"Configuration error: {e}")
-            sys.exit(1)
+def load_config() -> Config:
+    try:
+        return Config.load()
+    except ConfigError as e:
+        logger.error(f"Configuration error: {e}")
+        sys.exit(1)
 
-        intents = discord.Intents.default()
-        intents.members = True
-        intents.message_content = True
+
+class CrspyBot(commands.AutoShardedBot):
+    def __init__(self, config: Optional[Config] = None):
+        self.started_at = time.perf_counter()
+        self.config = config or load_config()
 
         super().__init__(
-            command_prefix=self.config.prefix,
-            intents=intents
+            **client_options(self.config),
+            shard_count=self.config.shard_count,
+            shard_ids=self.config.shard_ids,
         )
 
-        self.pending_verifications = {}
+        self.pending_verifications = create_state_backend(self.config)
+        self.guild_configs = GuildConfigIndex(
+            self.config, self.config.guild_config_path,
+            capacity=self.config.guild_config_cache_size,
+            default_guild_id=self.env_guild_id,
+        )
+        self.expiry_scheduler = ExpiryScheduler(self, edits_per_second=self.config.expiry_edits_per_second)
+        self.shard_stats = ShardStats(self)
+        self.loop_lag = LoopLagMonitor(stall_threshold=self.config.loop_stall_threshold)
+        self.metrics_server = None
+        if self.config.metrics_port:
+            self.metrics_server = MetricsServer(self.config.metrics_host, self.config.metrics_port)
+
+        metrics.gauge('pending_verifications', 'Pending challenges', callback=lambda: len(self.pending_verifications))
+        metrics.gauge('gateway_heartbeat_seconds', 'Mean gateway heartbeat latency', callback=lambda: self.latency)
+        metrics.gauge('expiry_scheduled', 'Challenge messages waiting to expire', callback=lambda: len(self.expiry_scheduler))
+        for outcome in ('expired', 'failed', 'dropped'):
+            metrics.gauge(
+                'expiry_records', 'Expiry records by outcome', {'outcome': outcome},
+                callback=lambda outcome=outcome: getattr(self.expiry_scheduler, outcome)
+            )
+
+    def env_guild_id(self) -> Optional[int]:
+        """The guild owning CHANNEL_ID, the only one that falls back to the environment settings."""
+        channel = self.get_channel(self.config.channel_id)
+        return channel.guild.id if channel is not None else None
+
+    def uptime(self) -> float:
+        """Seconds since the bot object was created."""
+        return time.perf_counter() - self.started_at
+
+    async def load_cog(self, name: str):
+        try:
+            await self.load_extension(f'cogs.{name}')
+            logger.info(f'Loaded cog: {name}')
+        except Exception as e:
+            logger.error(f'Failed to load cog {name}: {str(e)}')
 
     async def load_cogs(self):
-        """Loads all cogs from the cogs directory."""
-        for filename in os.listdir('./cogs'):
-            if filename.endswith('.py') and not filename.startswith('_'):
-                try:
-                    await self.load_extension(f'cogs.{filename[:-3]}')
-                    logger.info(f'Loaded cog: {filename[:-3]}')
-                except Exception as e:
-                    logger.error(f'Failed to load cog {filename[:-3]}: {str(e)}')
+        """Loads all cogs from the cogs directory concurrently."""
+        await asyncio.gather(*(
+            self.load_cog(filename[:-3])
+            for filename in os.listdir('./cogs')
+            if filename.endswith('.py') and not filename.startswith('_')
+        ))
 
     async def setup_hook(self):
         """Called when the bot is setting up."""
-        await self.load_cogs()
-        logger.info(f'Bot logged in as {self.user}')
+        self.expiry_scheduler.start()
+        self.shard_stats.start()
+        self.loop_lag.start()
+        startup = [self.pending_verifications.start(), self.load_cogs()]
+        if self.metrics_server is not None:
+            startup.append(self.metrics_server.start())
+        await asyncio.gather(*startup)
+        logger.info(f'Bot logged in as {self.user} ({self.uptime():.2f}s after start)')
+
+    async def on_ready(self):
+        logger.info(f'Gateway ready {self.uptime():.2f}s after start')
+
+    async def on_interaction(self, interaction: discord.Interaction):
+        self.shard_stats.record_interaction(interaction)
+
+    async def on_member_join(self, member: discord.Member):
+        self.shard_stats.record_member_join(member)
+
+    async def on_shard_ready(self, shard_id: int):
+        logger.info(f'Shard {shard_id} ready')
+
+    async def close(self):
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        self.loop_lag.stop()
+        self.shard_stats.stop()
+        self.expiry_scheduler.stop()
+        await super().close()
+        await self.pending_verifications.close()
+        await self.guild_configs.close()
 
 
-async def main():
-    bot = CrspyBot()
+async def main(config: Optional[Config] = None):
+    bot = CrspyBot(config)
 
     try:
         async with bot:
@@ -61,7 +133,11 @@ async def main():
 
 
 if __name__ == "__main__":
+    config = load_config()
     try:
-        asyncio.run(main())
+        run(lambda: main(config), config.event_loop)
+    except ConfigError as e:
+        logger.error(f"Configuration error: {e}")
+        sys.exit(1)
     except KeyboardInterrupt:
         logger.info("Shutting down from main thread...")
\ No newline at end of file
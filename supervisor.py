@@ -0,0 +1,120 @@
+"""
+Runs the bot as several processes, each owning a contiguous range of shards.
+
+    python supervisor.py --processes 4            # shard count recommended by Discord
+    python supervisor.py --processes 4 --shards 16
+
+Every child is a normal main.py process started with SHARD_COUNT and SHARD_IDS
+set. Children that exit are restarted with backoff. Interactions are always
+delivered to the shard that owns the guild, so each process handles its own
+challenges end to end. Use STATE_BACKEND=sqlite so in-flight challenges
+survive a child restart. With METRICS_PORT set, child N serves its metrics on
+METRICS_PORT + N.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import sys
+from typing import Dict, List
+import aiohttp
+from utils.logger import setup_logger
+from utils.config import Config, ConfigError
+
+logger = setup_logger()
+
+GATEWAY_URL = 'https://discord.com/api/v10/gateway/bot'
+MAX_BACKOFF = 60.0
+
+
+async def recommended_shards(token: str) -> int:
+    async with aiohttp.ClientSession() as session:
+        async with session.get(GATEWAY_URL, headers={'Authorization': f'Bot {token}'}) as response:
+            response.raise_for_status()
+            data = await response.json()
+    return data['shards']
+
+
+def split_shards(shard_count: int, processes: int) -> List[List[int]]:
+    processes = max(1, min(processes, shard_count))
+    size, extra = divmod(shard_count, processes)
+    groups = []
+    start = 0
+    for index in range(processes):
+        end = start + size + (1 if index < extra else 0)
+        groups.append(list(range(start, end)))
+        start = end
+    return groups
+
+
+class Supervisor:
+    def __init__(self, shard_count: int, groups: List[List[int]], metrics_port: int = 0):
+        self.shard_count = shard_count
+        self.groups = groups
+        self.metrics_port = metrics_port
+        self.children: Dict[int, asyncio.subprocess.Process] = {}
+        self.stopping = asyncio.Event()
+
+    async def _run_child(self, index: int, shard_ids: List[int]) -> None:
+        backoff = 1.0
+        env = dict(os.environ, SHARD_COUNT=str(self.shard_count), SHARD_IDS=','.join(map(str, shard_ids)))
+        if self.metrics_port:
+            env['METRICS_PORT'] = str(self.metrics_port + index)
+
+        while not self.stopping.is_set():
+            process = await asyncio.create_subprocess_exec(sys.executable, 'main.py', env=env)
+            self.children[index] = process
+            logger.info(f'Started process {index} (pid {process.pid}) for shards {shard_ids}')
+
+            returncode = await process.wait()
+            if self.stopping.is_set():
+                break
+
+            logger.error(f'Process {index} exited with code {returncode}, restarting in {backoff:.0f}s')
+            try:
+                await asyncio.wait_for(self.stopping.wait(), timeout=backoff)
+            except asyncio.TimeoutError:
+                pass
+            backoff = min(backoff * 2, MAX_BACKOFF)
+
+    def stop(self) -> None:
+        self.stopping.set()
+        for process in self.children.values():
+            if process.returncode is None:
+                process.terminate()
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stop)
+
+        await asyncio.gather(*(
+            self._run_child(index, shard_ids)
+            for index, shard_ids in enumerate(self.groups)
+        ))
+        logger.info('Supervisor shutdown complete')
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--shards', type=int, default=None, help='total shard count, asks Discord when omitted')
+    args = parser.parse_args()
+
+    try:
+        config = Config.load()
+    except ConfigError as e:
+        logger.error(f"Configuration error: {e}")
+        sys.exit(1)
+
+    shard_count = args.shards or config.shard_count or await recommended_shards(config.discord_token)
+    groups = split_shards(shard_count, args.processes)
+    logger.info(f'Running {shard_count} shards across {len(groups)} processes')
+    if config.state_backend == 'memory':
+        logger.info('STATE_BACKEND is memory, pending challenges are lost when a process restarts')
+
+    await Supervisor(shard_count, groups, config.metrics_port).run()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,70 @@
+import random
+import re
+from collections import Counter
+import numpy as np
+import pytest
+from utils.image_generator import RAVEN_PATTERNS, ImageGenerator
+
+SAMPLES = 20_000
+TERM = re.compile(r'^(\d+)(?:x(?:\^(\d+))?)?$')
+
+
+@pytest.fixture(scope='module')
+def generator():
+    return ImageGenerator()
+
+
+def solve(pattern_file: str, problem_text: str) -> int:
+    """Answers a problem from its printed text alone, the way a user has to."""
+    _, polynomial_line, question = problem_text.split('\n')
+    coefficients = {}
+    for term in polynomial_line.removeprefix('f(x) = ').split(' + '):
+        coef, power = TERM.match(term).groups()
+        power = int(power) if power else (1 if 'x' in term else 0)
+        assert power not in coefficients
+        coefficients[power] = int(coef)
+
+    for _ in range(question.count("'")):
+        coefficients = {power - 1: coef * power for power, coef in coefficients.items() if power}
+    x = RAVEN_PATTERNS[pattern_file]
+    return sum(coef * x ** power for power, coef in coefficients.items()) + x
+
+
+def summarize(problems):
+    orders = Counter(text.count("'") for _, text, _ in problems)
+    patterns = Counter(pattern for pattern, _, _ in problems)
+    answers = np.array([answer for _, _, answer in problems])
+    return (
+        {order: count / len(problems) for order, count in orders.items()},
+        {pattern: count / len(problems) for pattern, count in patterns.items()},
+        np.percentile(answers, [25, 50, 75]),
+    )
+
+
+def test_seeded_batches_are_reproducible(generator):
+    assert generator.generate_batch(500, seed=7) == generator.generate_batch(500, seed=7)
+    assert generator.generate_batch(500, seed=7) != generator.generate_batch(500, seed=8)
+
+
+def test_batch_matches_single_problem_distribution(generator):
+    random.seed(7)
+    single = [generator.generate_math_problem() for _ in range(SAMPLES)]
+    batch = generator.generate_batch(SAMPLES, seed=7)
+
+    single_orders, single_patterns, single_quartiles = summarize(single)
+    batch_orders, batch_patterns, batch_quartiles = summarize(batch)
+    assert single_orders.keys() == batch_orders.keys()
+    for order, share in single_orders.items():
+        assert batch_orders[order] == pytest.approx(share, abs=0.02)
+    assert single_patterns.keys() == batch_patterns.keys()
+    for pattern, share in single_patterns.items():
+        assert batch_patterns[pattern] == pytest.approx(share, abs=0.01)
+    assert batch_quartiles == pytest.approx(single_quartiles, rel=0.1, abs=2)
+
+
+def test_answers_match_printed_problems(generator):
+    random.seed(7)
+    problems = generator.generate_batch(SAMPLES, seed=7)
+    problems += [generator.generate_math_problem() for _ in range(SAMPLES // 10)]
+    for pattern_file, problem_text, answer in problems:
+        assert solve(pattern_file, problem_text) == answer, problem_text
@@ -0,0 +1,74 @@
+import time
+from contextlib import contextmanager
+from enum import Enum
+from typing import Dict
+from utils.models import PendingKey
+
+
+class Admission(Enum):
+    ADMITTED = 'admitted'
+    REUSED = 'reused'
+    REMINDED = 'reminded'
+    THROTTLED = 'throttled'
+    SHED = 'shed'
+
+
+class AdmissionController:
+    """
+    Decides whether a Verify click may start a new challenge. Cooldowns are kept per
+    member of a guild, like the pending challenges. Users with an unexpired challenge are pointed back at it, repeat clicks inside the
+    cooldown are throttled, and new renders are shed once the global concurrency limit
+    or the render backlog threshold is reached. Showing a pending challenge again costs a
+    render too, so it is subject to the same limits and only reminds the user otherwise.
+    """
+
+    def __init__(self, cooldown: float = 5.0, max_concurrent: int = 32, backlog_threshold: int = 32):
+        self.cooldown = cooldown
+        self.max_concurrent = max_concurrent
+        self.backlog_threshold = backlog_threshold
+        self.in_flight = 0
+        self.counts: Dict[Admission, int] = {decision: 0 for decision in Admission}
+        self._last_admitted: Dict[PendingKey, float] = {}
+
+    def _prune(self, now: float) -> None:
+        if len(self._last_admitted) > 10_000:
+            self._last_admitted = {
+                key: admitted_at for key, admitted_at in self._last_admitted.items()
+                if now - admitted_at < self.cooldown
+            }
+
+    def check(self, key: PendingKey, has_pending: bool, needs_render: bool, backlog: int) -> Admission:
+        """
+        `needs_render` is False when a pre-rendered challenge is ready, in which case
+        the render limits do not apply.
+        """
+        now = time.monotonic()
+        throttled = now - self._last_admitted.get(key, -self.cooldown) < self.cooldown
+        busy = self.in_flight >= self.max_concurrent or backlog >= self.backlog_threshold
+        if has_pending:
+            decision = Admission.REMINDED if throttled or busy else Admission.REUSED
+        elif throttled:
+            decision = Admission.THROTTLED
+        elif needs_render and busy:
+            decision = Admission.SHED
+        else:
+            decision = Admission.ADMITTED
+
+        if decision in (Admission.ADMITTED, Admission.REUSED):
+            self._prune(now)
+            self._last_admitted[key] = now
+
+        self.counts[decision] += 1
+        return decision
+
+    @contextmanager
+    def track(self):
+        """Counts an admitted challenge against the concurrency limit while it is generated."""
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+
+    def stats(self) -> dict:
+        return dict({decision.value: count for decision, count in self.counts.items()}, in_flight=self.in_flight)
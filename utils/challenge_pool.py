@@ -0,0 +1,131 @@
+import asyncio
+import math
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Optional
+import logging
+from utils.models import VerificationData
+
+logger = logging.getLogger('captcha_bot')
+
+DRAIN_WINDOW = 10.0
+
+
+@dataclass
+class PooledChallenge:
+    verification: VerificationData
+    image: bytes
+    filename: str = 'captcha.png'
+    # Quality level the image was rendered at, 0 is full quality.
+    level: int = 0
+
+
+class ChallengePool:
+    """
+    Bounded pool of ready challenges kept between a low and a high watermark.
+    A background producer refills the pool, with more renders in flight when it drains quickly.
+    """
+
+    def __init__(
+        self,
+        produce: Callable[[], Awaitable[PooledChallenge]],
+        low_watermark: int = 8,
+        high_watermark: int = 32,
+        max_parallel: int = 4,
+    ):
+        self.produce = produce
+        self.low_watermark = low_watermark
+        self.high_watermark = high_watermark
+        self.max_parallel = max(1, max_parallel)
+        self.hits = 0
+        self.misses = 0
+        self.produced = 0
+        self.discarded = 0
+        self._ready: Deque[PooledChallenge] = deque()
+        self._takes: Deque[float] = deque()
+        self._produce_seconds = 0.1
+        self._refill = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._ready)
+
+    @property
+    def enabled(self) -> bool:
+        return self.high_watermark > 0
+
+    def take(self) -> Optional[PooledChallenge]:
+        """Returns a ready challenge, or None when the pool is empty."""
+        now = time.monotonic()
+        self._takes.append(now)
+        while self._takes and now - self._takes[0] > DRAIN_WINDOW:
+            self._takes.popleft()
+
+        if self._ready:
+            challenge = self._ready.popleft()
+            self.hits += 1
+        else:
+            challenge = None
+            self.misses += 1
+
+        if len(self._ready) < self.low_watermark:
+            self._refill.set()
+        return challenge
+
+    def discard(self, predicate: Callable[[PooledChallenge], bool]) -> int:
+        """Drops the ready challenges matching `predicate` and refills the pool. Returns how many were dropped."""
+        kept = deque(challenge for challenge in self._ready if not predicate(challenge))
+        dropped = len(self._ready) - len(kept)
+        if dropped:
+            self._ready = kept
+            self.discarded += dropped
+            self._refill.set()
+        return dropped
+
+    def _parallelism(self) -> int:
+        """Renders to keep in flight, enough to cover the recent drain rate."""
+        drain_rate = len(self._takes) / DRAIN_WINDOW
+        wanted = math.ceil(drain_rate * self._produce_seconds) + 1
+        return max(1, min(self.max_parallel, wanted, self.high_watermark - len(self._ready)))
+
+    async def _produce_one(self) -> None:
+        started = time.perf_counter()
+        challenge = await self.produce()
+        elapsed = time.perf_counter() - started
+        self._produce_seconds = 0.8 * self._produce_seconds + 0.2 * elapsed
+        self._ready.append(challenge)
+        self.produced += 1
+
+    async def _run(self) -> None:
+        while True:
+            while len(self._ready) < self.high_watermark:
+                results = await asyncio.gather(
+                    *(self._produce_one() for _ in range(self._parallelism())),
+                    return_exceptions=True
+                )
+                errors = [result for result in results if isinstance(result, Exception)]
+                if errors:
+                    logger.warning(f'Challenge pool refill failed: {errors[0]}')
+                    await asyncio.sleep(1)
+
+            self._refill.clear()
+            await self._refill.wait()
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._ready),
+            'hits': self.hits,
+            'misses': self.misses,
+            'produced': self.produced,
+            'discarded': self.discarded,
+        }
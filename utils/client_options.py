@@ -0,0 +1,26 @@
+import discord
+from discord.ext import commands
+from utils.config import Config
+
+
+def client_options(config: Config) -> dict:
+    """
+    Gateway and cache options for the bot.
+    In low-memory mode nothing is chunked or cached per member: the verification flow
+    reads the clicking member, with its roles, from the interaction payload. Without the
+    message content intent prefix commands are only seen when they mention the bot.
+    """
+    intents = discord.Intents.default()
+    intents.members = True
+    intents.message_content = not config.low_memory
+
+    if not config.low_memory:
+        return dict(command_prefix=config.prefix, intents=intents)
+
+    return dict(
+        command_prefix=commands.when_mentioned_or(config.prefix),
+        intents=intents,
+        chunk_guilds_at_startup=False,
+        member_cache_flags=discord.MemberCacheFlags.none(),
+        max_messages=None,
+    )
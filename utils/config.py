@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Optional
+from typing import List, Optional
 import os
 from dotenv import load_dotenv
 
@@ -17,6 +17,45 @@ class Config:
     prefix: str
     success_color: int
     error_color: int
+    render_executor: str = 'thread'
+    render_workers: int = 0
+    render_queue_depth: int = 64
+    render_timeout: float = 10.0
+    pool_low_watermark: int = 8
+    pool_high_watermark: int = 32
+    image_profile: str = 'png'
+    pending_capacity: int = 50_000
+    expiry_edits_per_second: float = 5.0
+    state_backend: str = 'memory'
+    state_path: str = 'verification_state.db'
+    state_flush_interval: float = 0.5
+    shard_count: Optional[int] = None
+    shard_ids: Optional[List[int]] = None
+    role_grant_rate: float = 5.0
+    role_grant_burst: int = 10
+    verify_cooldown: float = 5.0
+    max_concurrent_renders: int = 32
+    render_backlog_threshold: int = 32
+    metrics_host: str = '127.0.0.1'
+    metrics_port: int = 0
+    verification_message_mode: str = 'reuse'
+    noise_bank_size: int = 0
+    noise_bank_path: str = 'noise_bank.bin'
+    noise_bank_refresh: float = 3600.0
+    pattern_atlas_path: Optional[str] = None
+    low_memory: bool = False
+    guild_config_path: str = 'guild_config.db'
+    guild_config_cache_size: int = 1024
+    adaptive_quality: bool = True
+    quality_queue_threshold: int = 8
+    quality_latency_threshold: float = 0.25
+    quality_lag_threshold: float = 0.1
+    quality_hold: float = 15.0
+    profile_dir: str = 'profiles'
+    profile_sample_rate: float = 0.1
+    profile_slow_callback: float = 0.05
+    event_loop: str = 'auto'
+    loop_stall_threshold: float = 0.25
 
     @classmethod
     def load_from_env(cls) -> 'Config':
@@ -36,12 +75,54 @@ class Config:
             discord_token = get_env('DISCORD_TOKEN')
             channel_id = int(get_env('CHANNEL_ID'))
             role_id = int(get_env('ROLE_ID'))
+            render_workers = int(get_env('RENDER_WORKERS', required=False) or 0)
+            render_queue_depth = int(get_env('RENDER_QUEUE_DEPTH', required=False) or 64)
+            render_timeout = float(get_env('RENDER_TIMEOUT', required=False) or 10.0)
+            pool_low_watermark = int(get_env('POOL_LOW_WATERMARK', required=False) or 8)
+            pool_high_watermark = int(get_env('POOL_HIGH_WATERMARK', required=False) or 32)
+            pending_capacity = int(get_env('PENDING_CAPACITY', required=False) or 50_000)
+            expiry_edits_per_second = float(get_env('EXPIRY_EDITS_PER_SECOND', required=False) or 5.0)
+            state_flush_interval = float(get_env('STATE_FLUSH_INTERVAL', required=False) or 0.5)
+            role_grant_rate = float(get_env('ROLE_GRANT_RATE', required=False) or 5.0)
+            role_grant_burst = int(get_env('ROLE_GRANT_BURST', required=False) or 10)
+            verify_cooldown = float(get_env('VERIFY_COOLDOWN', required=False) or 5.0)
+            max_concurrent_renders = int(get_env('MAX_CONCURRENT_RENDERS', required=False) or 32)
+            render_backlog_threshold = int(get_env('RENDER_BACKLOG_THRESHOLD', required=False) or 32)
+            metrics_port = int(get_env('METRICS_PORT', required=False) or 0)
+            noise_bank_size = int(get_env('NOISE_BANK_SIZE', required=False) or 0)
+            noise_bank_refresh = float(get_env('NOISE_BANK_REFRESH', required=False) or 3600.0)
+            guild_config_cache_size = int(get_env('GUILD_CONFIG_CACHE_SIZE', required=False) or 1024)
+            quality_queue_threshold = int(get_env('QUALITY_QUEUE_THRESHOLD', required=False) or 8)
+            quality_latency_threshold = float(get_env('QUALITY_LATENCY_THRESHOLD', required=False) or 0.25)
+            quality_lag_threshold = float(get_env('QUALITY_LAG_THRESHOLD', required=False) or 0.1)
+            quality_hold = float(get_env('QUALITY_HOLD', required=False) or 15.0)
+            profile_sample_rate = float(get_env('PROFILE_SAMPLE_RATE', required=False) or 0.1)
+            profile_slow_callback = float(get_env('PROFILE_SLOW_CALLBACK', required=False) or 0.05)
+            loop_stall_threshold = float(get_env('LOOP_STALL_THRESHOLD', required=False) or 0.25)
+            shard_count = get_env('SHARD_COUNT', required=False)
+            shard_count = int(shard_count) if shard_count else None
+            shard_ids = get_env('SHARD_IDS', required=False)
+            shard_ids = [int(shard_id) for shard_id in shard_ids.split(',')] if shard_ids else None
         except ValueError as e:
             raise ConfigError(f"Invalid environment variable value: {str(e)}")
 
         prefix = get_env('PREFIX', required=False) or "!"
         success = get_env('SUCCESS_COLOR', required=False) or 0x2B2D31
         error = get_env('ERROR_COLOR', required=False) or 15224897
+        render_executor = get_env('RENDER_EXECUTOR', required=False) or 'thread'
+        image_profile = get_env('IMAGE_PROFILE', required=False) or 'png'
+        state_backend = get_env('STATE_BACKEND', required=False) or 'memory'
+        state_path = get_env('STATE_PATH', required=False) or 'verification_state.db'
+        metrics_host = get_env('METRICS_HOST', required=False) or '127.0.0.1'
+        verification_message_mode = get_env('VERIFICATION_MESSAGE_MODE', required=False) or 'reuse'
+        noise_bank_path = get_env('NOISE_BANK_PATH', required=False) or 'noise_bank.bin'
+        # Unset or empty keeps the atlas off: it writes a file of every decoded pattern to disk.
+        pattern_atlas_path = get_env('PATTERN_ATLAS_PATH', required=False) or None
+        guild_config_path = get_env('GUILD_CONFIG_PATH', required=False) or 'guild_config.db'
+        profile_dir = get_env('PROFILE_DIR', required=False) or 'profiles'
+        event_loop = get_env('EVENT_LOOP', required=False) or 'auto'
+        low_memory = (get_env('LOW_MEMORY', required=False) or '').lower() in ('1', 'true', 'yes')
+        adaptive_quality = (get_env('ADAPTIVE_QUALITY', required=False) or 'true').lower() in ('1', 'true', 'yes')
 
         return cls(
             discord_token=discord_token,
@@ -50,6 +131,45 @@ class Config:
             prefix=prefix,
             success_color=success,
             error_color=error,
+            render_executor=render_executor,
+            render_workers=render_workers,
+            render_queue_depth=render_queue_depth,
+            render_timeout=render_timeout,
+            pool_low_watermark=pool_low_watermark,
+            pool_high_watermark=pool_high_watermark,
+            image_profile=image_profile,
+            pending_capacity=pending_capacity,
+            expiry_edits_per_second=expiry_edits_per_second,
+            state_backend=state_backend,
+            state_path=state_path,
+            state_flush_interval=state_flush_interval,
+            shard_count=shard_count,
+            shard_ids=shard_ids,
+            role_grant_rate=role_grant_rate,
+            role_grant_burst=role_grant_burst,
+            verify_cooldown=verify_cooldown,
+            max_concurrent_renders=max_concurrent_renders,
+            render_backlog_threshold=render_backlog_threshold,
+            metrics_host=metrics_host,
+            metrics_port=metrics_port,
+            verification_message_mode=verification_message_mode,
+            noise_bank_size=noise_bank_size,
+            noise_bank_path=noise_bank_path,
+            noise_bank_refresh=noise_bank_refresh,
+            pattern_atlas_path=pattern_atlas_path,
+            low_memory=low_memory,
+            guild_config_path=guild_config_path,
+            guild_config_cache_size=guild_config_cache_size,
+            adaptive_quality=adaptive_quality,
+            quality_queue_threshold=quality_queue_threshold,
+            quality_latency_threshold=quality_latency_threshold,
+            quality_lag_threshold=quality_lag_threshold,
+            quality_hold=quality_hold,
+            profile_dir=profile_dir,
+            profile_sample_rate=profile_sample_rate,
+            profile_slow_callback=profile_slow_callback,
+            event_loop=event_loop,
+            loop_stall_threshold=loop_stall_threshold,
         )
 
     def validate(self) -> None:
@@ -59,6 +179,50 @@ class Config:
         """
         if len(self.prefix) > 3:
             raise ConfigError("Prefix must be 3 characters or less")
+        if self.render_executor not in ('inline', 'thread', 'process'):
+            raise ConfigError("RENDER_EXECUTOR must be one of: inline, thread, process")
+        if self.render_workers < 0 or self.render_queue_depth < 1 or self.render_timeout <= 0:
+            raise ConfigError("Render pool settings must be positive")
+        if not 0 <= self.pool_low_watermark <= self.pool_high_watermark:
+            raise ConfigError("POOL_LOW_WATERMARK must be between 0 and POOL_HIGH_WATERMARK")
+        if self.image_profile not in ('png', 'png_fast', 'png_palette', 'webp'):
+            raise ConfigError("IMAGE_PROFILE must be one of: png, png_fast, png_palette, webp")
+        if self.pending_capacity < 1:
+            raise ConfigError("PENDING_CAPACITY must be positive")
+        if self.expiry_edits_per_second <= 0:
+            raise ConfigError("EXPIRY_EDITS_PER_SECOND must be positive")
+        if self.state_backend not in ('memory', 'sqlite'):
+            raise ConfigError("STATE_BACKEND must be one of: memory, sqlite")
+        if self.state_flush_interval <= 0:
+            raise ConfigError("STATE_FLUSH_INTERVAL must be positive")
+        if self.role_grant_rate <= 0 or self.role_grant_burst < 1:
+            raise ConfigError("ROLE_GRANT_RATE and ROLE_GRANT_BURST must be positive")
+        if self.verify_cooldown < 0 or self.max_concurrent_renders < 1 or self.render_backlog_threshold < 1:
+            raise ConfigError("Admission control settings must be positive")
+        if not 0 <= self.metrics_port <= 65535:
+            raise ConfigError("METRICS_PORT must be a valid port, or 0 to disable the endpoint")
+        if self.verification_message_mode not in ('reuse', 'recreate'):
+            raise ConfigError("VERIFICATION_MESSAGE_MODE must be one of: reuse, recreate")
+        if self.noise_bank_size < 0 or self.noise_bank_refresh < 0:
+            raise ConfigError("NOISE_BANK_SIZE and NOISE_BANK_REFRESH must not be negative")
+        if self.guild_config_cache_size < 1:
+            raise ConfigError("GUILD_CONFIG_CACHE_SIZE must be positive")
+        if (self.quality_queue_threshold < 1 or self.quality_latency_threshold <= 0
+                or self.quality_lag_threshold <= 0 or self.quality_hold < 0):
+            raise ConfigError("Adaptive quality thresholds must be positive")
+        if not 0 <= self.profile_sample_rate <= 1 or self.profile_slow_callback <= 0:
+            raise ConfigError("PROFILE_SAMPLE_RATE must be between 0 and 1 and PROFILE_SLOW_CALLBACK positive")
+        if self.event_loop not in ('auto', 'asyncio', 'uvloop'):
+            raise ConfigError("EVENT_LOOP must be one of: auto, asyncio, uvloop")
+        if self.loop_stall_threshold < 0:
+            raise ConfigError("LOOP_STALL_THRESHOLD must not be negative")
+        if self.shard_count is not None and self.shard_count < 1:
+            raise ConfigError("SHARD_COUNT must be positive")
+        if self.shard_ids is not None:
+            if self.shard_count is None:
+                raise ConfigError("SHARD_IDS requires SHARD_COUNT")
+            if any(not 0 <= shard_id < self.shard_count for shard_id in self.shard_ids):
+                raise ConfigError("SHARD_IDS must be between 0 and SHARD_COUNT - 1")
 
     @classmethod
     def load(cls) -> 'Config':
@@ -0,0 +1,74 @@
+import io
+import threading
+import time
+from dataclasses import dataclass, field
+from PIL import Image
+from typing import Dict
+
+
+@dataclass(frozen=True)
+class EncodingProfile:
+    """How a rendered challenge is turned into upload bytes."""
+    name: str
+    format: str
+    extension: str
+    options: Dict = field(default_factory=dict)
+    palette_colors: int = 0
+
+    def prepare(self, image: Image.Image) -> Image.Image:
+        # Challenges are fully opaque, so dropping alpha loses nothing and shrinks every format.
+        image = image.convert('RGB')
+        if self.palette_colors:
+            image = image.quantize(colors=self.palette_colors, method=Image.Quantize.MEDIANCUT)
+        return image
+
+
+ENCODING_PROFILES = {
+    'png': EncodingProfile('png', 'PNG', 'png'),
+    'png_fast': EncodingProfile('png_fast', 'PNG', 'png', {'compress_level': 1}),
+    'png_palette': EncodingProfile('png_palette', 'PNG', 'png', {'compress_level': 6}, palette_colors=64),
+    'webp': EncodingProfile('webp', 'WEBP', 'webp', {'quality': 80, 'method': 2}),
+}
+
+
+class ImageEncoder:
+    """
+    Encodes challenge images with one profile and keeps running time and size totals
+    for this process. Render threads share an encoder, so the totals are locked.
+    """
+
+    def __init__(self, profile: str = 'png'):
+        if profile not in ENCODING_PROFILES:
+            raise ValueError(f"Unknown encoding profile: {profile}")
+        self.profile = ENCODING_PROFILES[profile]
+        self.count = 0
+        self.total_seconds = 0.0
+        self.total_bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def filename(self) -> str:
+        return f"captcha.{self.profile.extension}"
+
+    def encode(self, image: Image.Image) -> io.BytesIO:
+        started = time.perf_counter()
+        buffer = io.BytesIO()
+        self.profile.prepare(image).save(buffer, format=self.profile.format, **self.profile.options)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.total_seconds += elapsed
+            self.total_bytes += buffer.tell()
+            self.count += 1
+
+        buffer.seek(0)
+        return buffer
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, total_seconds, total_bytes = self.count, self.total_seconds, self.total_bytes
+        return {
+            'profile': self.profile.name,
+            'count': count,
+            'mean_encode_ms': total_seconds / count * 1000 if count else 0.0,
+            'mean_bytes': total_bytes / count if count else 0.0,
+        }
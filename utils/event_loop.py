@@ -0,0 +1,43 @@
+import asyncio
+import importlib.util
+import sys
+from typing import Callable, Coroutine
+import logging
+from utils.config import ConfigError
+
+logger = logging.getLogger('captcha_bot')
+
+EVENT_LOOPS = ('auto', 'asyncio', 'uvloop')
+
+
+def resolve_event_loop(name: str = 'auto') -> str:
+    """
+    The loop backend to run on. `auto` picks uvloop when it is installed; asking for
+    uvloop explicitly without it installed is a configuration error.
+    """
+    if name not in EVENT_LOOPS:
+        raise ConfigError(f"EVENT_LOOP must be one of: {', '.join(EVENT_LOOPS)}")
+    available = importlib.util.find_spec('uvloop') is not None
+    if name == 'uvloop' and not available:
+        raise ConfigError("EVENT_LOOP=uvloop but uvloop is not installed")
+    if name == 'auto':
+        return 'uvloop' if available else 'asyncio'
+    return name
+
+
+def run(main: Callable[[], Coroutine], name: str = 'auto'):
+    """
+    asyncio.run on the selected loop backend. `main` builds the coroutine, so nothing
+    is left unawaited when the backend turns out to be unavailable.
+    """
+    backend = resolve_event_loop(name)
+    logger.info(f'Using the {backend} event loop')
+    if backend == 'asyncio':
+        return asyncio.run(main())
+
+    import uvloop
+    if sys.version_info >= (3, 11):
+        with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+            return runner.run(main())
+    uvloop.install()
+    return asyncio.run(main())
@@ -0,0 +1,132 @@
+import asyncio
+import heapq
+import itertools
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+import discord
+import logging
+
+logger = logging.getLogger('captcha_bot')
+
+# Discord accepts edits through an interaction token for 15 minutes after the interaction.
+TOKEN_LIFETIME = 15 * 60
+TOKEN_MARGIN = 5.0
+
+
+@dataclass(slots=True, order=True)
+class ExpiryRecord:
+    due: float
+    seq: int
+    application_id: int = field(compare=False)
+    token: str = field(compare=False)
+    view: discord.ui.View = field(compare=False)
+    # Unix time the interaction was created, its token lapses TOKEN_LIFETIME later.
+    created_at: float = field(compare=False)
+
+
+class ExpiryScheduler:
+    """
+    Single task that swaps expired challenge messages to their disabled view.
+    Due records are handled in batches and edits are rate limited so they
+    don't compete with live interactions for the same HTTP buckets.
+    Records keep only the interaction's webhook credentials, not the interaction,
+    and the edit goes through `client`'s HTTP session. Records whose token has lapsed,
+    or that fell more than `max_lag` seconds behind, are dropped without an API call,
+    so a sustained rate above the edit budget can't build an unbounded backlog.
+    """
+
+    def __init__(
+        self,
+        client: Optional[discord.Client] = None,
+        edits_per_second: float = 5.0,
+        batch_size: int = 25,
+        max_lag: float = 60.0,
+    ):
+        self.client = client
+        self.edits_per_second = edits_per_second
+        self.batch_size = batch_size
+        self.max_lag = max_lag
+        self.expired = 0
+        self.failed = 0
+        self.dropped = 0
+        self._records: List[ExpiryRecord] = []
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def schedule(self, interaction: discord.Interaction, view: discord.ui.View, delay: float) -> None:
+        """Edits the interaction's original response to `view` once `delay` seconds have passed."""
+        record = ExpiryRecord(
+            time.monotonic() + delay, next(self._counter), interaction.application_id, interaction.token, view,
+            interaction.created_at.timestamp()
+        )
+        heapq.heappush(self._records, record)
+        if self._records[0] is record:
+            self._wakeup.set()
+
+    def _due_batch(self) -> List[ExpiryRecord]:
+        now = time.monotonic()
+        token_cutoff = time.time() - TOKEN_LIFETIME + TOKEN_MARGIN
+        batch = []
+        while self._records and self._records[0].due <= now and len(batch) < self.batch_size:
+            record = heapq.heappop(self._records)
+            if record.created_at <= token_cutoff or now - record.due > self.max_lag:
+                self.dropped += 1
+                continue
+            batch.append(record)
+        return batch
+
+    async def _expire(self, record: ExpiryRecord) -> None:
+        try:
+            webhook = discord.Webhook.partial(record.application_id, record.token, client=self.client)
+            await webhook.edit_message('@original', view=record.view)
+            self.expired += 1
+        except discord.HTTPException as e:
+            # The user may have dismissed the message, or the token already lapsed.
+            self.failed += 1
+            logger.debug(f'Could not expire challenge message: {e}')
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            if not self._records:
+                await self._wakeup.wait()
+                continue
+
+            delay = self._records[0].due - time.monotonic()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            batch = self._due_batch()
+            started = time.monotonic()
+            await asyncio.gather(*(self._expire(record) for record in batch))
+
+            budget = len(batch) / self.edits_per_second
+            remaining = budget - (time.monotonic() - started)
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            'scheduled': len(self._records),
+            'expired': self.expired,
+            'failed': self.failed,
+            'dropped': self.dropped,
+        }
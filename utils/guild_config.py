@@ -0,0 +1,179 @@
+import asyncio
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, fields, replace
+from typing import Callable, Dict, List, Optional, Tuple
+import logging
+from utils.config import Config
+
+logger = logging.getLogger('captcha_bot')
+
+DIFFICULTIES = (1, 2, 3)
+DEFAULT_DIFFICULTY = 3
+# Other processes sharing the file can change a guild, so entries are re-read after a while.
+CACHE_TTL = 60.0
+
+
+@dataclass(slots=True, frozen=True)
+class GuildSettings:
+    """Verification settings for one guild. Difficulty is the highest derivative order asked for."""
+    guild_id: int
+    channel_id: int
+    role_id: int
+    success_color: int
+    error_color: int
+    difficulty: int = DEFAULT_DIFFICULTY
+
+    @classmethod
+    def from_config(cls, guild_id: int, config: Config) -> 'GuildSettings':
+        """Settings taken from the environment, for guilds without their own row."""
+        return cls(
+            guild_id=guild_id,
+            channel_id=config.channel_id,
+            role_id=config.role_id,
+            success_color=config.success_color,
+            error_color=config.error_color,
+        )
+
+    @classmethod
+    def unconfigured(cls, guild_id: int, config: Config) -> 'GuildSettings':
+        """The environment colors with no channel or role, for styling replies in guilds that are not configured."""
+        return cls(
+            guild_id=guild_id,
+            channel_id=0,
+            role_id=0,
+            success_color=config.success_color,
+            error_color=config.error_color,
+        )
+
+
+COLUMNS = tuple(field.name for field in fields(GuildSettings))
+
+
+class GuildConfigIndex:
+    """
+    Per-guild settings in a SQLite file, loaded on demand into a bounded LRU cache.
+    Only the guild that owns CHANNEL_ID, as reported by `default_guild_id`, falls back
+    to the environment settings; other guilds without a row are not configured. Misses
+    are cached as well. Changes made through this index replace the cached entry immediately.
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        path: str,
+        capacity: int = 1024,
+        default_guild_id: Callable[[], Optional[int]] = lambda: None,
+    ):
+        self.config = config
+        self.path = path
+        self.capacity = capacity
+        self.default_guild_id = default_guild_id
+        self.hits = 0
+        self.misses = 0
+        self._cache: 'OrderedDict[int, Tuple[Optional[GuildSettings], float]]' = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='guild-config')
+        self._connection: Optional[sqlite3.Connection] = None
+        self._loading: Dict[int, asyncio.Future] = {}
+
+    def _run(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS guild_config ('
+                'guild_id INTEGER PRIMARY KEY, channel_id INTEGER NOT NULL, role_id INTEGER NOT NULL, '
+                'success_color INTEGER NOT NULL, error_color INTEGER NOT NULL, difficulty INTEGER NOT NULL, '
+                'updated_at REAL NOT NULL)'
+            )
+        return self._connection
+
+    def _read(self, guild_id: int) -> Optional[GuildSettings]:
+        row = self._connect().execute(
+            f'SELECT {", ".join(COLUMNS)} FROM guild_config WHERE guild_id = ?', (guild_id,)
+        ).fetchone()
+        return GuildSettings(*row) if row is not None else None
+
+    def _read_all(self) -> List[GuildSettings]:
+        rows = self._connect().execute(f'SELECT {", ".join(COLUMNS)} FROM guild_config').fetchall()
+        return [GuildSettings(*row) for row in rows]
+
+    def _write(self, settings: GuildSettings) -> None:
+        connection = self._connect()
+        with connection:
+            connection.execute(
+                f'INSERT OR REPLACE INTO guild_config ({", ".join(COLUMNS)}, updated_at) '
+                f'VALUES ({", ".join("?" * (len(COLUMNS) + 1))})',
+                tuple(getattr(settings, column) for column in COLUMNS) + (time.time(),)
+            )
+
+    def _remember(self, guild_id: int, settings: Optional[GuildSettings]) -> None:
+        self._cache[guild_id] = (settings, time.monotonic())
+        self._cache.move_to_end(guild_id)
+        while len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+
+    async def get(self, guild_id: Optional[int]) -> Optional[GuildSettings]:
+        """Settings for a guild, read from the database on a cache miss. None when it is not configured."""
+        if guild_id is None:
+            return None
+
+        entry = self._cache.get(guild_id)
+        if entry is None or time.monotonic() - entry[1] > CACHE_TTL:
+            # Concurrent misses for the same guild share one read.
+            loading = self._loading.get(guild_id)
+            if loading is None:
+                self.misses += 1
+                loading = self._loading[guild_id] = self._run(self._read, guild_id)
+                try:
+                    settings = await asyncio.shield(loading)
+                    self._remember(guild_id, settings)
+                finally:
+                    del self._loading[guild_id]
+            else:
+                settings = await asyncio.shield(loading)
+        else:
+            self.hits += 1
+            settings = entry[0]
+            self._cache.move_to_end(guild_id)
+        if settings is None and guild_id == self.default_guild_id():
+            return GuildSettings.from_config(guild_id, self.config)
+        return settings
+
+    async def set(self, settings: GuildSettings) -> None:
+        """Stores a guild's settings and replaces its cached entry."""
+        await self._run(self._write, settings)
+        self._remember(settings.guild_id, settings)
+
+    async def update(self, guild_id: int, **changes) -> GuildSettings:
+        """Changes some settings of a configured guild. Raises KeyError for other guilds."""
+        current = await self.get(guild_id)
+        if current is None:
+            raise KeyError(guild_id)
+        settings = replace(current, **changes)
+        await self.set(settings)
+        return settings
+
+    def invalidate(self, guild_id: int) -> None:
+        self._cache.pop(guild_id, None)
+
+    async def configured(self) -> List[GuildSettings]:
+        """Every guild with its own row. Only used at startup, so the cache is left alone."""
+        return await self._run(self._read_all)
+
+    async def close(self) -> None:
+        if self._connection is not None:
+            await self._run(self._connection.close)
+            self._connection = None
+        self._executor.shutdown(wait=True)
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def stats(self) -> dict:
+        return {'cached': len(self._cache), 'hits': self.hits, 'misses': self.misses}
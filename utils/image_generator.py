@@ -1,45 +1,91 @@
-import os
 import random
-from PIL import Image, ImageDraw, ImageFont
+import time
+from collections import deque
+from PIL import Image, ImageDraw
 import io
-from typing import Tuple
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+import numpy as np
 import logging
+from utils.pattern_cache import PatternCache
+from utils.noise_renderer import NoiseRenderer
+from utils.noise_bank import NoiseBank
+from utils.encoding import ImageEncoder
+from utils.quality import FULL_QUALITY, QualityTier
 
 logger = logging.getLogger('captcha_bot')
 
+MAX_COEFFICIENT = 20
+MAX_TERMS = 4
+MAX_DERIVATIVE_ORDER = 3
+PROBLEM_BATCH_SIZE = 256
+
+
+def format_problem(coefficients: Sequence[int], derivative_order: int) -> str:
+    """
+    Problem text for the given coefficients. `coefficients[i]` multiplies x^i, as in the
+    answer computation; terms are shown highest power first.
+    """
+    terms = []
+    for i, coef in enumerate(coefficients):
+        if coef != 0:
+            if i == 0:
+                terms.append(str(coef))
+            elif i == 1:
+                terms.append(f"{coef}x")
+            else:
+                terms.append(f"{coef}x^{i}")
+    polynomial = " + ".join(reversed(terms)) or "0"
+
+    primes = "'" * derivative_order
+    return (
+        f"Let x be the correct pattern\n"
+        f"f(x) = {polynomial}\n"
+        f"What is f{primes}(x) + x?"
+    )
+
+
+RAVEN_PATTERNS = {
+    'raven0.gif': 5, 'raven1.gif': 3, 'raven2.gif': 4,
+    'raven3.gif': 1, 'raven4.gif': 6, 'raven5.gif': 5,
+    'raven6.gif': 5, 'raven7.gif': 4, 'raven8.gif': 8,
+    'raven9.gif': 5, 'raven10.gif': 1, 'raven11.gif': 3,
+    'raven12.gif': 2, 'raven13.gif': 1, 'raven14.gif': 7,
+    'raven15.gif': 2, 'raven16.gif': 7, 'raven17.gif': 4,
+    'raven18.gif': 3, 'raven19.gif': 1, 'raven20.gif': 8,
+    'raven21.gif': 7, 'raven22.gif': 5, 'raven23.gif': 1,
+    'raven24.gif': 5
+}
+
 
 class ImageGenerator:
-    def __init__(self):
-        self.raven_patterns = {
-            'raven0.gif': 5, 'raven1.gif': 3, 'raven2.gif': 4,
-            'raven3.gif': 1, 'raven4.gif': 6, 'raven5.gif': 5,
-            'raven6.gif': 5, 'raven7.gif': 4, 'raven8.gif': 8,
-            'raven9.gif': 5, 'raven10.gif': 1, 'raven11.gif': 3,
-            'raven12.gif': 2, 'raven13.gif': 1, 'raven14.gif': 7,
-            'raven15.gif': 2, 'raven16.gif': 7, 'raven17.gif': 4,
-            'raven18.gif': 3, 'raven19.gif': 1, 'raven20.gif': 8,
-            'raven21.gif': 7, 'raven22.gif': 5, 'raven23.gif': 1,
-            'raven24.gif': 5
-        }
-
-    def generate_math_problem(self) -> Tuple[str, str, int]:
+    def __init__(
+        self,
+        encoding_profile: str = 'png',
+        noise_bank: Optional[NoiseBank] = None,
+        pattern_atlas: Optional[str] = None,
+    ):
+        self.raven_patterns = dict(RAVEN_PATTERNS)
+        self.pattern_cache = PatternCache(self.raven_patterns, atlas_path=pattern_atlas)
+        self.noise_renderer = NoiseRenderer(self.pattern_cache.noise_font)
+        self.encoder = ImageEncoder(encoding_profile)
+        self.encoders: Dict[str, ImageEncoder] = {encoding_profile: self.encoder}
+        self.noise_bank = noise_bank
+        self.rng = np.random.default_rng()
+        self._pattern_names = list(self.raven_patterns)
+        self._pattern_answers = np.array([self.raven_patterns[name] for name in self._pattern_names], dtype=np.int64)
+        self._problems: Deque[Tuple[str, str, int]] = deque()
+
+    def reload(self) -> None:
+        """Reloads the pattern cache and rebuilds the glyph atlas from the new fonts."""
+        self.pattern_cache.reload()
+        self.noise_renderer = NoiseRenderer(self.pattern_cache.noise_font)
+
+    def generate_math_problem(self, max_derivative_order: int = MAX_DERIVATIVE_ORDER) -> Tuple[str, str, int]:
         pattern_file = random.choice(list(self.raven_patterns.keys()))
         pattern_answer = self.raven_patterns[pattern_file]
 
-        coefficients = [random.randint(0, 20) for _ in range(random.randint(3, 4))]
-
-        terms = []
-        for i, coef in enumerate(reversed(coefficients)):
-            if coef != 0:
-                if i == 0:
-                    terms.append(str(coef))
-                elif i == 1:
-                    terms.append(f"{coef}x")
-                else:
-                    terms.append(f"{coef}x^{i}")
-        polynomial = " + ".join(reversed(terms))
-
-        derivative_order = random.randint(1, 3)
+        coefficients = [random.randint(0, MAX_COEFFICIENT) for _ in range(random.randint(3, MAX_TERMS))]
+        derivative_order = random.randint(1, max_derivative_order)
         current_coefficients = coefficients.copy()
 
         for _ in range(derivative_order):
@@ -51,13 +97,52 @@ class ImageGenerator:
         x = pattern_answer
         result = sum(coef * (x ** i) for i, coef in enumerate(current_coefficients)) + x
 
-        problem_text = (
-            f"Let x be the correct pattern\n"
-            f"f(x) = {polynomial}\n"
-            f"What is f{''.join(['\'' for _ in range(derivative_order)])}(x) + x?"
-        )
-
-        return pattern_file, problem_text, result
+        return pattern_file, format_problem(coefficients, derivative_order), result
+
+    def generate_batch(
+        self,
+        n: int,
+        seed: Optional[int] = None,
+        max_derivative_order: int = MAX_DERIVATIVE_ORDER,
+    ) -> List[Tuple[str, str, int]]:
+        """
+        Generates n problems at once, with the same distribution as generate_math_problem.
+        Passing a seed makes the batch reproducible.
+        """
+        rng = np.random.default_rng(seed) if seed is not None else self.rng
+
+        patterns = rng.integers(0, len(self._pattern_names), size=n)
+        lengths = rng.integers(3, MAX_TERMS, size=n, endpoint=True)
+        coefficients = rng.integers(0, MAX_COEFFICIENT, size=(n, MAX_TERMS), endpoint=True, dtype=np.int64)
+        orders = rng.integers(1, max_derivative_order, size=n, endpoint=True)
+        # Shorter polynomials are padded with zero coefficients, which leaves the answer unchanged.
+        coefficients[np.arange(MAX_TERMS) >= lengths[:, None]] = 0
+
+        derivatives = coefficients
+        powers = np.arange(1, MAX_TERMS, dtype=np.int64)
+        for step in range(MAX_DERIVATIVE_ORDER):
+            differentiated = np.zeros_like(derivatives)
+            differentiated[:, :-1] = derivatives[:, 1:] * powers
+            derivatives = np.where((orders > step)[:, None], differentiated, derivatives)
+
+        x = self._pattern_answers[patterns]
+        answers = np.zeros(n, dtype=np.int64)
+        for column in range(MAX_TERMS - 1, -1, -1):
+            answers = answers * x + derivatives[:, column]
+        answers += x
+
+        return [
+            (self._pattern_names[pattern], format_problem(row[:length], order), answer)
+            for pattern, length, row, order, answer in zip(
+                patterns.tolist(), lengths.tolist(), coefficients.tolist(), orders.tolist(), answers.tolist()
+            )
+        ]
+
+    def next_problem(self) -> Tuple[str, str, int]:
+        """Takes the next problem from a buffer refilled with generate_batch."""
+        if not self._problems:
+            self._problems.extend(self.generate_batch(PROBLEM_BATCH_SIZE))
+        return self._problems.popleft()
 
     def generate_background_text(self) -> str:
         """Generate random mathematical-looking text for background."""
@@ -69,60 +154,76 @@ class ImageGenerator:
         return text
 
     async def create_problem_image(self, pattern_file: str, problem_text: str) -> io.BytesIO:
+        return self.render_problem_image(pattern_file, problem_text)
+
+    def compose_base(self, pattern_file: str, problem_text: str) -> Image.Image:
+        """Pastes the pattern tile and draws the problem text onto a fresh RGBA canvas."""
+        combined_image = Image.new('RGBA', (360, 460), 'white')
+        combined_image.paste(self.pattern_cache.tile(pattern_file), (0, 0))
+
+        draw = ImageDraw.Draw(combined_image)
+
+        question_font = self.pattern_cache.question_font
+
+        lines = problem_text.split('\n')
+        for i, line in enumerate(lines):
+            y_pos = 380 + (i * 25)
+            draw.text(
+                (10, y_pos),
+                line,
+                fill='black',
+                font=question_font,
+                stroke_width=0.125,
+                stroke_fill='black',
+            )
+        return combined_image
+
+    def apply_noise(self, image: Image.Image, glyph_count: Optional[int] = None) -> None:
+        """Composites a pre-rendered overlay when a noise bank is available, otherwise draws the glyphs."""
+        bank = self.noise_bank
+        if bank is not None and (bank.ready or bank.reload_if_changed()):
+            bank.apply(image)
+        else:
+            self.noise_renderer.render(image, glyph_count)
+
+    def encoder_for(self, profile: Optional[str] = None) -> ImageEncoder:
+        """The encoder for a profile, the configured one when None."""
+        if profile is None:
+            return self.encoder
+        encoder = self.encoders.get(profile)
+        if encoder is None:
+            encoder = self.encoders[profile] = ImageEncoder(profile)
+        return encoder
+
+    def encode(self, image: Image.Image, profile: Optional[str] = None) -> io.BytesIO:
+        return self.encoder_for(profile).encode(image)
+
+    def render_problem_image(
+        self,
+        pattern_file: str,
+        problem_text: str,
+        timings: Optional[Dict[str, float]] = None,
+        tier: Optional[QualityTier] = None,
+    ) -> io.BytesIO:
+        """
+        Synchronous renderer, safe to run in a worker thread or process.
+        Per-stage durations in seconds are written to `timings` when given.
+        A quality tier lowers the glyph count and picks the encoding profile.
+        """
+        tier = tier or FULL_QUALITY
         try:
-            pattern_image = Image.open(os.path.join('img', pattern_file))
-            pattern_image = pattern_image.convert('RGB')
-            pattern_image = pattern_image.resize((360, 360))
-
-            combined_image = Image.new('RGB', (360, 460), 'white')
-            combined_image.paste(pattern_image, (0, 0))
-
-            combined_image = combined_image.convert('RGBA')
-            draw = ImageDraw.Draw(combined_image)
-
-            try:
-                question_font = ImageFont.truetype('Arial', 16)
-                noise_font = ImageFont.truetype('Arial', 32)
-            except:
-                question_font = ImageFont.load_default()
-                noise_font = ImageFont.load_default()
-
-            lines = problem_text.split('\n')
-            for i, line in enumerate(lines):
-                y_pos = 380 + (i * 25)
-                draw.text(
-                    (10, y_pos),
-                    line,
-                    fill='black',
-                    font=question_font,
-                    stroke_width=0.125,
-                    stroke_fill='black',
-                )
-
-            chars = ''.join(chr(i) for i in range(32, 127))
-            for _ in range(125):
-
-                x = random.randint(0, combined_image.width - 1)
-                y = random.randint(0, combined_image.height - 1)
-                noise_text = random.choice(chars)
-                if random.random() < 0.3:
-                    noise_text += random.choice(chars)
-
-                noise_layer = Image.new('RGBA', combined_image.size, (255, 255, 255, 0))
-                noise_draw = ImageDraw.Draw(noise_layer)
-
-                noise_draw.text(
-                    (x, y),
-                    noise_text,
-                    fill=(200, 80, 0, 90),
-                    font=noise_font
-                )
-                combined_image = Image.alpha_composite(combined_image, noise_layer)
-
-            buffer = io.BytesIO()
-            combined_image.save(buffer, format='PNG')
-            buffer.seek(0)
+            started = time.perf_counter()
+            combined_image = self.compose_base(pattern_file, problem_text)
+            composed = time.perf_counter()
+            self.apply_noise(combined_image, tier.glyph_count)
+            noised = time.perf_counter()
+            buffer = self.encode(combined_image, tier.encoding_profile)
+
+            if timings is not None:
+                timings['compose'] = composed - started
+                timings['noise'] = noised - composed
+                timings['encode'] = time.perf_counter() - noised
             return buffer
         except Exception as e:
             logger.error(f'Error creating problem image: {str(e)}')
-            raise
\ No newline at end of file
+            raise
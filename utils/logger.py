@@ -1,13 +1,138 @@
+import atexit
+import json
 import logging
+import os
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+from dotenv import load_dotenv
+
+_listener: Optional[QueueListener] = None
+
+
+class _Fields:
+    """Renders structured fields as key=value pairs, only when the record is formatted."""
+    __slots__ = ('fields',)
+
+    def __init__(self, fields: dict):
+        self.fields = fields
+
+    def __str__(self) -> str:
+        return ' '.join(f'{key}={value}' for key, value in self.fields.items())
+
+
+def log_event(logger: logging.Logger, event: str, level: int = logging.INFO, **fields) -> None:
+    """
+    Logs a single-line structured event. Nothing is formatted on the calling thread;
+    the text output renders `EVENT key=value ...` and the JSON output keeps the fields.
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, '%s %s', event, _Fields(fields), extra={'event': event, 'fields': fields})
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One compact JSON object per record."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        document = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+        }
+        event = getattr(record, 'event', None)
+        if event is not None:
+            document['event'] = event
+            document.update(record.fields)
+        else:
+            document['msg'] = record.getMessage()
+        if record.exc_info:
+            document['exc'] = self.formatException(record.exc_info)
+        return json.dumps(document, default=str, separators=(',', ':'))
+
+
+class BatchingStreamHandler(logging.StreamHandler):
+    """Buffers formatted records and writes them in batches."""
+
+    def __init__(self, stream=None, batch_size: int = 64, flush_interval: float = 0.25):
+        super().__init__(stream)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._last_flush = time.monotonic()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self._buffer.append(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+            return
+        if len(self._buffer) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        with self.lock:
+            if self._buffer:
+                self.stream.write(''.join(self._buffer))
+                self._buffer = []
+            super().flush()
+            self._last_flush = time.monotonic()
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    QueueHandler formats records before queueing them, which would put the formatting
+    cost back on the event loop. The queue never leaves the process, so records can
+    be handed over as they are and formatted by the listener thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class FlushingQueueListener(QueueListener):
+    """Flushes batching handlers when the queue goes quiet, so the last records are never held back."""
+
+    def __init__(self, log_queue, *handlers, flush_interval: float = 0.25):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.flush_interval = flush_interval
+
+    def dequeue(self, block: bool):
+        while True:
+            try:
+                return self.queue.get(block=block, timeout=self.flush_interval if block else None)
+            except queue.Empty:
+                if not block:
+                    raise
+                for handler in self.handlers:
+                    handler.flush()
+
+
+def setup_logger(log_format: Optional[str] = None):
+    """
+    Hands records to a background thread through a queue, so logging never blocks the
+    event loop. LOG_FORMAT=json switches to batched JSON lines.
+    """
+    global _listener
+
+    load_dotenv()
+    log_format = log_format or os.getenv('LOG_FORMAT') or 'text'
 
-def setup_logger():
     logger = logging.getLogger('captcha_bot')
     logger.setLevel(logging.INFO)
+    if _listener is not None:
+        return logger
 
-    formatter = logging.Formatter('[%(asctime)s] %(message)s', datefmt='%Y-%m-%dT%H:%M:%S.%fZ')
+    if log_format == 'json':
+        handler = BatchingStreamHandler()
+        handler.setFormatter(JsonLinesFormatter())
+    else:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('[%(asctime)s] %(message)s', datefmt='%Y-%m-%dT%H:%M:%S.%fZ'))
 
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(LazyQueueHandler(log_queue))
 
-    logger.addHandler(console_handler)
-    return logger
\ No newline at end of file
+    _listener = FlushingQueueListener(log_queue, handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return logger
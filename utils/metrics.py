@@ -0,0 +1,256 @@
+import asyncio
+import bisect
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from aiohttp import web
+import logging
+from utils.logger import log_event
+
+logger = logging.getLogger('captcha_bot')
+
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Optional[Dict[str, str]]) -> LabelKey:
+    return tuple(sorted((labels or {}).items()))
+
+
+def _format_labels(key: LabelKey, extra: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class Gauge:
+    """A settable value, or a callback read at scrape time."""
+    __slots__ = ('value', 'callback')
+
+    def __init__(self, callback: Optional[Callable[[], float]] = None):
+        self.value = 0.0
+        self.callback = callback
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def read(self) -> float:
+        return float(self.callback()) if self.callback is not None else self.value
+
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is a bisect and three additions."""
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def quantile(self, fraction: float) -> float:
+        """Upper bound of the bucket holding the given quantile."""
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        running = 0
+        for index, count in enumerate(self.counts):
+            running += count
+            if running >= target:
+                return self.buckets[index] if index < len(self.buckets) else float('inf')
+        return float('inf')
+
+
+class MetricsRegistry:
+    """Process-wide metrics, exported in the Prometheus text format."""
+
+    def __init__(self):
+        self._families: Dict[str, Tuple[str, str, Dict[LabelKey, object]]] = {}
+
+    def _get(self, kind: str, name: str, help_text: str, labels: Optional[Dict[str, str]], factory):
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = (kind, help_text, {})
+        key = _label_key(labels)
+        metric = family[2].get(key)
+        if metric is None:
+            metric = family[2][key] = factory()
+        return metric
+
+    def counter(self, name: str, help_text: str = '', labels: Optional[Dict[str, str]] = None) -> Counter:
+        return self._get('counter', name, help_text, labels, Counter)
+
+    def gauge(
+        self,
+        name: str,
+        help_text: str = '',
+        labels: Optional[Dict[str, str]] = None,
+        callback: Optional[Callable[[], float]] = None,
+    ) -> Gauge:
+        gauge = self._get('gauge', name, help_text, labels, Gauge)
+        if callback is not None:
+            gauge.callback = callback
+        return gauge
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str = '',
+        labels: Optional[Dict[str, str]] = None,
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._get('histogram', name, help_text, labels, lambda: Histogram(buckets))
+
+    def families(self) -> Dict[str, Tuple[str, str, Dict[LabelKey, object]]]:
+        return self._families
+
+    def render_prometheus(self) -> str:
+        lines: List[str] = []
+        for name, (kind, help_text, metrics) in sorted(self._families.items()):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for key, metric in metrics.items():
+                if kind == 'counter':
+                    lines.append(f'{name}{_format_labels(key)} {metric.value}')
+                elif kind == 'gauge':
+                    try:
+                        value = metric.read()
+                    except Exception as e:
+                        logger.debug(f'Gauge {name} failed: {e}')
+                        continue
+                    lines.append(f'{name}{_format_labels(key)} {value}')
+                else:
+                    running = 0
+                    for bound, count in zip(metric.buckets, metric.counts):
+                        running += count
+                        lines.append(f'{name}_bucket{_format_labels(key, [("le", repr(bound))])} {running}')
+                    lines.append(f'{name}_bucket{_format_labels(key, [("le", "+Inf")])} {metric.count}')
+                    lines.append(f'{name}_sum{_format_labels(key)} {metric.sum}')
+                    lines.append(f'{name}_count{_format_labels(key)} {metric.count}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+
+class LoopLagMonitor:
+    """
+    Measures how late a periodic sleep wakes up, i.e. how long the event loop was blocked.
+    With a stall threshold a watchdog thread also checks on the loop while it is blocked,
+    and logs the loop thread's stack once per stall that runs past the threshold.
+    """
+
+    def __init__(self, interval: float = 0.5, stall_threshold: float = 0.0):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.histogram = metrics.histogram('event_loop_lag_seconds', 'Event loop scheduling lag')
+        self.stalls = metrics.counter('event_loop_stalls_total', 'Loop stalls longer than the watchdog threshold')
+        self.last_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            self._heartbeat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.last_lag = max(0.0, time.perf_counter() - started - self.interval)
+            self.histogram.observe(self.last_lag)
+
+    def _watch(self) -> None:
+        reported = None
+        while not self._stopped.wait(self.stall_threshold / 2):
+            heartbeat = self._heartbeat
+            blocked = time.monotonic() - heartbeat - self.interval
+            if blocked < self.stall_threshold or heartbeat == reported:
+                continue
+
+            reported = heartbeat
+            self.stalls.inc()
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = ''.join(traceback.format_stack(frame)) if frame is not None else 'unavailable'
+            log_event(logger, 'LOOP_STALL', logging.WARNING, blocked_ms=round(blocked * 1000), stack='\n' + stack)
+
+    def start(self) -> None:
+        if self._task is None:
+            loop = asyncio.get_running_loop()
+            backend = type(loop).__module__.split('.')[0]
+            metrics.gauge('event_loop_backend', 'Event loop implementation in use', {'backend': backend}).set(1)
+            self._task = loop.create_task(self._run())
+        if self.stall_threshold > 0 and self._watchdog is None:
+            self._loop_thread_id = threading.get_ident()
+            self._stopped.clear()
+            self._watchdog = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+            self._watchdog.start()
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._watchdog is not None:
+            self._stopped.set()
+            self._watchdog = None
+
+
+class MetricsServer:
+    """Serves GET /metrics on a local port."""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 9100):
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render_prometheus(), content_type='text/plain', charset='utf-8')
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self.host, self.port).start()
+        except OSError as e:
+            # The bot is more important than its metrics, keep starting without them.
+            logger.error(f'Could not serve metrics on {self.host}:{self.port}: {e}')
+            await self.stop()
+            return
+        logger.info(f'Metrics available at http://{self.host}:{self.port}/metrics')
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
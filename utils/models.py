@@ -1,8 +1,16 @@
 from dataclasses import dataclass
+from typing import Tuple
 
-@dataclass
+CHALLENGE_LIFETIME = 60 * 10
+
+# Pending challenges belong to a member of one guild: (guild_id, user_id).
+PendingKey = Tuple[int, int]
+
+
+@dataclass(slots=True)
 class VerificationData:
     answer: int
     pattern_file: str
     polynomial: str
-    attempts: int = 0
\ No newline at end of file
+    attempts: int = 0
+    guild_id: int = 0
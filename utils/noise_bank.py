@@ -0,0 +1,147 @@
+import mmap
+import os
+import random
+import struct
+import time
+from PIL import Image
+from typing import Optional, Tuple
+import logging
+
+logger = logging.getLogger('captcha_bot')
+
+MAGIC = b'NBNK'
+VERSION = 1
+# magic, version, overlay width, overlay height, overlay count, created at
+HEADER = struct.Struct('<4sHHHId')
+HEADER_SIZE = 64
+CANVAS_SIZE = (360, 460)
+# Overlays are larger than the canvas so each use can start at a random offset.
+OVERLAY_PADDING = 40
+# Noise glyphs per canvas-sized area, as drawn by the per-render noise pass.
+GLYPHS_PER_CANVAS = 125
+
+
+class NoiseBank:
+    """
+    Pre-rendered RGBA noise overlays in a raw file, read through mmap.
+    Every process maps the same file, so the overlays live once in the page cache.
+    The file is replaced atomically on rebuild and readers remap it when it changes.
+    """
+
+    def __init__(self, path: str, count: int = 32, check_interval: float = 5.0):
+        self.path = path
+        self.count = count
+        self.check_interval = check_interval
+        self.width = 0
+        self.height = 0
+        self.created_at = 0.0
+        self._mapping: Optional[Tuple[mmap.mmap, int, int, int]] = None
+        self._identity: Optional[Tuple[int, int]] = None
+        self._last_check = 0.0
+
+    @property
+    def ready(self) -> bool:
+        return self._mapping is not None
+
+    @property
+    def overlay_bytes(self) -> int:
+        return self.width * self.height * 4
+
+    def _file_identity(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def load(self) -> bool:
+        """Maps the bank file. Returns False when it is missing or not a valid bank."""
+        try:
+            with open(self.path, 'rb') as f:
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                identity = (os.fstat(f.fileno()).st_ino, os.fstat(f.fileno()).st_mtime_ns)
+        except (OSError, ValueError):
+            return False
+
+        if len(mapping) < HEADER_SIZE:
+            return False
+        magic, version, width, height, count, created_at = HEADER.unpack_from(mapping, 0)
+        if magic != MAGIC or version != VERSION or len(mapping) < HEADER_SIZE + width * height * 4 * count:
+            logger.warning(f'Ignoring invalid noise bank {self.path}')
+            return False
+
+        # The previous mapping is left to the garbage collector, renders may still hold images backed by it.
+        self._mapping = (mapping, width, height, count)
+        self._identity = identity
+        self.width, self.height, self.created_at = width, height, created_at
+        return True
+
+    def reload_if_changed(self) -> bool:
+        """Remaps the file after a rebuild, checking at most once per check_interval."""
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return False
+        self._last_check = now
+
+        identity = self._file_identity()
+        if identity is None or identity == self._identity:
+            return False
+        return self.load()
+
+    def build(self, noise_renderer) -> None:
+        """Renders `count` overlays with the glyph renderer and atomically replaces the file."""
+        started = time.perf_counter()
+        width = CANVAS_SIZE[0] + OVERLAY_PADDING
+        height = CANVAS_SIZE[1] + OVERLAY_PADDING
+        glyph_count = round(GLYPHS_PER_CANVAS * width * height / (CANVAS_SIZE[0] * CANVAS_SIZE[1]))
+
+        temporary = f'{self.path}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, width, height, self.count, time.time()).ljust(HEADER_SIZE, b'\0'))
+            for _ in range(self.count):
+                overlay = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+                noise_renderer.render(overlay, glyph_count)
+                f.write(overlay.tobytes())
+        os.replace(temporary, self.path)
+
+        self.load()
+        logger.info(
+            f'Built noise bank {self.path}: {self.count} overlays, '
+            f'{os.path.getsize(self.path) / 2 ** 20:.1f} MiB in {time.perf_counter() - started:.2f}s'
+        )
+
+    def ensure(self, noise_renderer, max_age: float = 0.0) -> None:
+        """Loads the bank, rebuilding it when it is missing, sized differently or older than max_age."""
+        if self.load() and self._mapping[3] == self.count and (
+            not max_age or time.time() - self.created_at < max_age
+        ):
+            return
+        self.build(noise_renderer)
+
+    def overlay(self, index: int) -> Image.Image:
+        """A read-only image over the mapped overlay, without copying it."""
+        mapping, width, height, _ = self._mapping
+        start = HEADER_SIZE + index * width * height * 4
+        view = memoryview(mapping)[start:start + width * height * 4]
+        return Image.frombuffer('RGBA', (width, height), view, 'raw', 'RGBA', 0, 1)
+
+    def apply(self, canvas: Image.Image) -> None:
+        """Composites a random overlay, at a random offset and orientation, onto an RGBA canvas."""
+        self.reload_if_changed()
+        _, width, height, count = self._mapping
+
+        x = random.randint(0, max(0, width - canvas.width))
+        y = random.randint(0, max(0, height - canvas.height))
+        region = self.overlay(random.randrange(count)).crop((x, y, x + canvas.width, y + canvas.height))
+        if random.random() < 0.5:
+            region = region.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+        if random.random() < 0.5:
+            region = region.transpose(Image.Transpose.FLIP_TOP_BOTTOM)
+        canvas.alpha_composite(region)
+
+    def stats(self) -> dict:
+        return {
+            'overlays': self._mapping[3] if self._mapping else 0,
+            'bytes': os.path.getsize(self.path) if self._mapping else 0,
+            'age_seconds': time.time() - self.created_at if self._mapping else 0.0,
+        }
@@ -0,0 +1,63 @@
+import random
+from PIL import Image, ImageDraw
+from typing import Dict, Optional, Tuple
+
+NOISE_CHARS = ''.join(chr(i) for i in range(32, 127))
+NOISE_FILL = (200, 80, 0, 90)
+
+Glyph = Tuple[Image.Image, int, int]
+
+
+class NoiseRenderer:
+    """
+    Stamps pre-rasterized noise glyphs onto a canvas.
+    Each glyph is composited over its own bounding box only, which matches compositing
+    a full-canvas layer per glyph without allocating and blending 125 canvases.
+    """
+
+    def __init__(self, font, glyph_count: int = 125):
+        self.font = font
+        self.glyph_count = glyph_count
+        self.atlas: Dict[str, Optional[Glyph]] = {char: self._rasterize(char) for char in NOISE_CHARS}
+        self.advances: Dict[str, int] = {char: round(font.getlength(char)) for char in NOISE_CHARS}
+
+    def _rasterize(self, text: str) -> Optional[Glyph]:
+        left, top, right, bottom = self.font.getbbox(text)
+        if right <= left or bottom <= top:
+            return None
+
+        glyph = Image.new('RGBA', (right - left, bottom - top), (255, 255, 255, 0))
+        ImageDraw.Draw(glyph).text((-left, -top), text, fill=NOISE_FILL, font=self.font)
+        return glyph, left, top
+
+    @staticmethod
+    def _stamp(canvas: Image.Image, glyph: Glyph, x: int, y: int) -> None:
+        image, left, top = glyph
+        x += left
+        y += top
+
+        # alpha_composite only accepts non-negative offsets, so clip on the source side.
+        source_x = max(0, -x)
+        source_y = max(0, -y)
+        if source_x >= image.width or source_y >= image.height:
+            return
+        if x >= canvas.width or y >= canvas.height:
+            return
+
+        canvas.alpha_composite(image, (x + source_x, y + source_y), (source_x, source_y))
+
+    def render(self, canvas: Image.Image, glyph_count: Optional[int] = None) -> None:
+        """Draws the noise glyphs onto an RGBA canvas in place."""
+        for _ in range(self.glyph_count if glyph_count is None else glyph_count):
+            x = random.randint(0, canvas.width - 1)
+            y = random.randint(0, canvas.height - 1)
+            noise_text = random.choice(NOISE_CHARS)
+            if random.random() < 0.3:
+                noise_text += random.choice(NOISE_CHARS)
+
+            # Two-character noise is stamped glyph by glyph at the font's advance.
+            for char in noise_text:
+                glyph = self.atlas[char]
+                if glyph is not None:
+                    self._stamp(canvas, glyph, x, y)
+                x += self.advances[char]
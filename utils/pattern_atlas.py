@@ -0,0 +1,133 @@
+"""
+Packs the decoded pattern tiles into one file that every render process maps.
+
+Build or refresh the atlas from the repository root with:
+
+    python -m utils.pattern_atlas
+"""
+import argparse
+import hashlib
+import mmap
+import os
+import struct
+from PIL import Image
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger('captcha_bot')
+
+MAGIC = b'PATL'
+VERSION = 1
+# magic, version, tile count, sha256 of the source images
+HEADER = struct.Struct('<4sHH32s')
+HEADER_SIZE = 64
+# file name, data offset, width, height
+ENTRY = struct.Struct('<64sQHH')
+# Tiles are stored as RGBA, a mode Pillow can map without copying.
+TILE_MODE = 'RGBA'
+DATA_ALIGNMENT = 4096
+
+
+def source_checksum(pattern_files: Iterable[str], directory: str) -> bytes:
+    """SHA-256 over the names and contents of the pattern images."""
+    digest = hashlib.sha256()
+    for pattern_file in sorted(pattern_files):
+        digest.update(pattern_file.encode())
+        with open(os.path.join(directory, pattern_file), 'rb') as f:
+            digest.update(f.read())
+    return digest.digest()
+
+
+def build_atlas(
+    pattern_files: Iterable[str],
+    directory: str,
+    path: str,
+    tile_size: Tuple[int, int],
+    checksum: Optional[bytes] = None,
+) -> None:
+    """Decodes and resizes every pattern and writes them to `path`, replacing it atomically."""
+    pattern_files = list(pattern_files)
+    checksum = checksum or source_checksum(pattern_files, directory)
+    tile_bytes = tile_size[0] * tile_size[1] * len(TILE_MODE)
+
+    index_end = HEADER_SIZE + ENTRY.size * len(pattern_files)
+    data_start = -(-index_end // DATA_ALIGNMENT) * DATA_ALIGNMENT
+    entries = [
+        (pattern_file, data_start + position * tile_bytes)
+        for position, pattern_file in enumerate(pattern_files)
+    ]
+
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(pattern_files), checksum).ljust(HEADER_SIZE, b'\0'))
+        for pattern_file, offset in entries:
+            f.write(ENTRY.pack(pattern_file.encode(), offset, *tile_size))
+        f.write(b'\0' * (data_start - index_end))
+        for pattern_file, _ in entries:
+            with Image.open(os.path.join(directory, pattern_file)) as image:
+                f.write(image.convert('RGB').resize(tile_size).convert(TILE_MODE).tobytes())
+    os.replace(temporary, path)
+    logger.info(f'Built pattern atlas {path} with {len(entries)} tiles')
+
+
+def read_atlas(path: str, checksum: bytes) -> Optional[Dict[str, Image.Image]]:
+    """
+    Maps the atlas and returns tiles that are views into the mapping.
+    Returns None when the file is missing, invalid or built from other images.
+    """
+    try:
+        with open(path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    if len(mapping) < HEADER_SIZE:
+        return None
+    magic, version, count, stored_checksum = HEADER.unpack_from(mapping, 0)
+    if magic != MAGIC or version != VERSION or stored_checksum != checksum:
+        return None
+
+    tiles = {}
+    view = memoryview(mapping)
+    for position in range(count):
+        name, offset, width, height = ENTRY.unpack_from(mapping, HEADER_SIZE + position * ENTRY.size)
+        size = width * height * len(TILE_MODE)
+        if offset + size > len(mapping):
+            return None
+        tiles[name.rstrip(b'\0').decode()] = Image.frombuffer(
+            TILE_MODE, (width, height), view[offset:offset + size], 'raw', TILE_MODE, 0, 1
+        )
+    return tiles
+
+
+def load_atlas(
+    pattern_files: Iterable[str],
+    directory: str,
+    path: str,
+    tile_size: Tuple[int, int],
+) -> Dict[str, Image.Image]:
+    """Maps the atlas, rebuilding it first when the images in `directory` have changed."""
+    pattern_files = list(pattern_files)
+    checksum = source_checksum(pattern_files, directory)
+    tiles = read_atlas(path, checksum)
+    if tiles is None or set(tiles) != set(pattern_files):
+        build_atlas(pattern_files, directory, path, tile_size, checksum)
+        tiles = read_atlas(path, checksum)
+    return tiles
+
+
+def main(argv: Optional[List[str]] = None):
+    from utils.image_generator import RAVEN_PATTERNS
+    from utils.pattern_cache import TILE_SIZE
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--directory', default='img')
+    parser.add_argument('--output', default=os.getenv('PATTERN_ATLAS_PATH') or 'pattern_atlas.bin')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    build_atlas(RAVEN_PATTERNS, args.directory, args.output, TILE_SIZE)
+
+
+if __name__ == '__main__':
+    main()
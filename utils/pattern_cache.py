@@ -0,0 +1,90 @@
+import os
+from PIL import Image, ImageFont
+from typing import Dict, Iterable, Optional, Tuple
+import logging
+from utils.pattern_atlas import TILE_MODE, load_atlas
+
+logger = logging.getLogger('captcha_bot')
+
+TILE_SIZE = (360, 360)
+
+
+class PatternCache:
+    """
+    Holds the decoded pattern tiles and fonts so renders never touch the disk.
+    With an atlas path the tiles are views into a shared memory-mapped file.
+    """
+
+    def __init__(self, pattern_files: Iterable[str], directory: str = 'img', atlas_path: Optional[str] = None):
+        self.pattern_files = list(pattern_files)
+        self.directory = directory
+        self.atlas_path = atlas_path
+        self.tiles: Dict[str, Image.Image] = {}
+        self.question_font = None
+        self.noise_font = None
+        self._signature: Tuple = ()
+        self.reload()
+
+    def _directory_signature(self) -> Tuple:
+        signature = []
+        for pattern_file in self.pattern_files:
+            try:
+                stat = os.stat(os.path.join(self.directory, pattern_file))
+                signature.append((pattern_file, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append((pattern_file, None, None))
+        return tuple(signature)
+
+    def _load_fonts(self) -> None:
+        try:
+            self.question_font = ImageFont.truetype('Arial', 16)
+            self.noise_font = ImageFont.truetype('Arial', 32)
+        except OSError:
+            self.question_font = ImageFont.load_default()
+            self.noise_font = ImageFont.load_default()
+
+    def _decode(self) -> Dict[str, Image.Image]:
+        tiles = {}
+        for pattern_file in self.pattern_files:
+            with Image.open(os.path.join(self.directory, pattern_file)) as image:
+                tiles[pattern_file] = image.convert('RGB').resize(TILE_SIZE).convert(TILE_MODE)
+        return tiles
+
+    def reload(self) -> None:
+        """Loads every pattern and the fonts, replacing the current cache."""
+        tiles = None
+        source = self.atlas_path
+        if self.atlas_path:
+            try:
+                tiles = load_atlas(self.pattern_files, self.directory, self.atlas_path, TILE_SIZE)
+            except OSError as e:
+                logger.warning(f'Pattern atlas unavailable, decoding patterns instead: {e}')
+        if tiles is None:
+            tiles = self._decode()
+            source = self.directory
+
+        self._signature = self._directory_signature()
+        self.tiles = tiles
+        self._load_fonts()
+        logger.info(f'Pattern cache loaded {len(tiles)} tiles from {source} ({self.memory_usage() / 1024:.0f} KiB)')
+
+    def is_stale(self) -> bool:
+        """Returns True when a pattern file in the image directory has changed since the last load."""
+        return self._directory_signature() != self._signature
+
+    def reload_if_changed(self) -> bool:
+        if not self.is_stale():
+            return False
+        self.reload()
+        return True
+
+    def tile(self, pattern_file: str) -> Image.Image:
+        """Returns the cached tile. Callers must paste or copy it, never draw on it."""
+        return self.tiles[pattern_file]
+
+    def memory_usage(self) -> int:
+        """Approximate number of bytes held by the decoded tiles."""
+        return sum(
+            tile.width * tile.height * len(tile.getbands())
+            for tile in self.tiles.values()
+        )
@@ -0,0 +1,122 @@
+import heapq
+import time
+from typing import Dict, List, Optional, Tuple
+import logging
+from utils.models import CHALLENGE_LIFETIME, PendingKey, VerificationData
+
+logger = logging.getLogger('captcha_bot')
+
+
+class PendingVerificationStore:
+    """
+    Pending challenges keyed by (guild ID, user ID), with a per-entry TTL and a hard capacity.
+    Expiry is driven by a min-heap of deadlines and runs lazily on writes and reads,
+    so no background task is needed. When full, the entry closest to expiring is evicted.
+    """
+
+    def __init__(self, ttl: float = CHALLENGE_LIFETIME, capacity: int = 50_000):
+        self.ttl = ttl
+        self.capacity = capacity
+        self.evictions = 0
+        self.expirations = 0
+        self._entries: Dict[PendingKey, Tuple[float, VerificationData]] = {}
+        self._deadlines: List[Tuple[float, PendingKey]] = []
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: PendingKey) -> bool:
+        return self.get(key) is not None
+
+    def __getitem__(self, key: PendingKey) -> VerificationData:
+        data = self.get(key)
+        if data is None:
+            raise KeyError(key)
+        return data
+
+    def __setitem__(self, key: PendingKey, data: VerificationData) -> None:
+        self.set(key, data)
+
+    def get(self, key: PendingKey, default: Optional[VerificationData] = None) -> Optional[VerificationData]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        if entry[0] <= time.time():
+            del self._entries[key]
+            self.expirations += 1
+            return default
+        return entry[1]
+
+    def expires_at(self, key: PendingKey) -> Optional[float]:
+        """Unix timestamp at which the member's challenge expires, or None if there is none."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.time():
+            return None
+        return entry[0]
+
+    def set(self, key: PendingKey, data: VerificationData, expires_at: Optional[float] = None) -> None:
+        """
+        Stores a challenge. Writing back the same challenge object (e.g. after a wrong
+        attempt) keeps its original deadline; a new challenge starts a fresh TTL.
+        """
+        now = time.time()
+        self.purge_expired(now)
+
+        existing = self._entries.get(key)
+        if expires_at is None:
+            if existing is not None and existing[1] is data:
+                expires_at = existing[0]
+            else:
+                expires_at = now + self.ttl
+
+        if existing is None and len(self._entries) >= self.capacity:
+            self._evict()
+
+        self._entries[key] = (expires_at, data)
+        if existing is None or existing[0] != expires_at:
+            heapq.heappush(self._deadlines, (expires_at, key))
+        self._compact()
+
+    def pop(self, key: PendingKey, default: Optional[VerificationData] = None) -> Optional[VerificationData]:
+        entry = self._entries.pop(key, None)
+        if entry is None or entry[0] <= time.time():
+            return default
+        return entry[1]
+
+    def _is_current(self, deadline: float, key: PendingKey) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and entry[0] == deadline
+
+    def purge_expired(self, now: Optional[float] = None) -> int:
+        """Drops every expired entry and returns how many were removed."""
+        now = time.time() if now is None else now
+        removed = 0
+        while self._deadlines and self._deadlines[0][0] <= now:
+            deadline, key = heapq.heappop(self._deadlines)
+            if self._is_current(deadline, key):
+                del self._entries[key]
+                removed += 1
+        self.expirations += removed
+        return removed
+
+    def _evict(self) -> None:
+        while self._deadlines:
+            deadline, key = heapq.heappop(self._deadlines)
+            if self._is_current(deadline, key):
+                del self._entries[key]
+                self.evictions += 1
+                return
+
+    def _compact(self) -> None:
+        # Entries popped before their deadline leave stale heap records behind.
+        if len(self._deadlines) > 2 * len(self._entries) + 1024:
+            self._deadlines = [(entry[0], key) for key, entry in self._entries.items()]
+            heapq.heapify(self._deadlines)
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._entries),
+            'capacity': self.capacity,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
@@ -0,0 +1,259 @@
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import random
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import partial
+from typing import Callable, Dict, List, Optional, Sequence
+import logging
+from utils.metrics import Histogram, metrics
+
+logger = logging.getLogger('captcha_bot')
+
+PROFILE_KINDS = ('cpu', 'memory', 'loop')
+MAX_PROFILE_SECONDS = 300
+TRACEMALLOC_FRAMES = 16
+REPORT_LINES = 40
+
+
+class _SlowCallbackRecorder:
+    """
+    Times every callback the event loop runs and keeps the slow ones. This is what the
+    loop's debug mode reports, without debug mode capturing a stack for every callback.
+    """
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.records: List[str] = []
+        self.supported = True
+        self._original = None
+
+    @staticmethod
+    def describe(handle: asyncio.Handle) -> str:
+        task = getattr(handle._callback, '__self__', None)
+        if isinstance(task, asyncio.Task):
+            return repr(task.get_coro())
+        return repr(handle)
+
+    def install(self) -> None:
+        # Other loop implementations, such as uvloop, run their own handle types.
+        self.supported = isinstance(asyncio.get_running_loop(), asyncio.BaseEventLoop)
+        original = self._original = asyncio.Handle._run
+        recorder = self
+
+        def _run(handle):
+            started = time.perf_counter()
+            try:
+                original(handle)
+            finally:
+                elapsed = time.perf_counter() - started
+                if elapsed >= recorder.threshold:
+                    recorder.records.append(f'{elapsed * 1000:.1f}ms {recorder.describe(handle)}')
+
+        asyncio.Handle._run = _run
+
+    def uninstall(self) -> None:
+        if self._original is not None:
+            asyncio.Handle._run = self._original
+            self._original = None
+
+
+class ProfilingSession:
+    """
+    One profiling window. CPU profiling covers the event loop thread and, through
+    `Profiler.wrap`, the calls handed to the render thread pool; process pool workers
+    are not profiled. Everything is switched back off in `stop`.
+    """
+
+    def __init__(self, kinds: Sequence[str], seconds: float, slow_callback: float):
+        self.kinds = tuple(kinds)
+        self.seconds = seconds
+        self.slow_callback = slow_callback
+        self.started_at = time.time()
+        self.spans: Dict[str, List[float]] = defaultdict(list)
+        self.cpu: Optional[cProfile.Profile] = None
+        self.thread_profiles: List[cProfile.Profile] = []
+        self.memory_start: Optional[tracemalloc.Snapshot] = None
+        self.memory_end: Optional[tracemalloc.Snapshot] = None
+        self._started_tracemalloc = False
+        self._slow_callbacks: Optional[_SlowCallbackRecorder] = None
+
+    def start(self) -> None:
+        """Must be called on the event loop thread."""
+        if 'cpu' in self.kinds:
+            self.cpu = cProfile.Profile()
+            self.cpu.enable()
+        if 'memory' in self.kinds:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+                self._started_tracemalloc = True
+            self.memory_start = tracemalloc.take_snapshot()
+        if 'loop' in self.kinds:
+            self._slow_callbacks = _SlowCallbackRecorder(self.slow_callback)
+            self._slow_callbacks.install()
+
+    def stop(self) -> None:
+        """Must be called on the event loop thread, the CPU profiler belongs to it."""
+        if self.cpu is not None:
+            self.cpu.disable()
+        if self._slow_callbacks is not None:
+            self._slow_callbacks.uninstall()
+
+    def run_profiled(self, func: Callable, *args):
+        """Runs a call on a worker thread under its own profiler."""
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler already owns this thread.
+            return func(*args)
+        try:
+            return func(*args)
+        finally:
+            profile.disable()
+            self.thread_profiles.append(profile)
+
+    def write_reports(self, directory: str) -> List[str]:
+        """
+        Writes one text report per kind, plus the raw CPU profile for external viewers.
+        The closing memory snapshot is taken here, off the event loop.
+        """
+        if self.memory_start is not None:
+            self.memory_end = tracemalloc.take_snapshot()
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+
+        os.makedirs(directory, exist_ok=True)
+        prefix = os.path.join(directory, time.strftime('%Y%m%dT%H%M%S', time.localtime(self.started_at)))
+        paths = [self._write(f'{prefix}-spans.txt', self.span_report())]
+
+        if self.cpu is not None:
+            stats = pstats.Stats(self.cpu)
+            for profile in self.thread_profiles:
+                stats.add(profile)
+            stats.dump_stats(f'{prefix}-cpu.prof')
+            buffer = io.StringIO()
+            stats.stream = buffer
+            stats.sort_stats('cumulative').print_stats(REPORT_LINES)
+            stats.sort_stats('tottime').print_stats(REPORT_LINES)
+            paths += [self._write(f'{prefix}-cpu.txt', buffer.getvalue()), f'{prefix}-cpu.prof']
+
+        if self.memory_end is not None:
+            lines = [f'Top {REPORT_LINES} allocation sites by growth over {self.seconds:g}s']
+            for stat in self.memory_end.compare_to(self.memory_start, 'lineno')[:REPORT_LINES]:
+                lines.append(str(stat))
+            paths.append(self._write(f'{prefix}-memory.txt', '\n'.join(lines)))
+
+        if self._slow_callbacks is not None:
+            lines = [f'{len(self._slow_callbacks.records)} callbacks took longer than {self.slow_callback * 1000:g}ms']
+            if not self._slow_callbacks.supported:
+                lines.append('Callbacks are only timed on the asyncio event loop, see the LOOP_STALL log events instead.')
+            lines += self._slow_callbacks.records
+            paths.append(self._write(f'{prefix}-loop.txt', '\n'.join(lines)))
+        return paths
+
+    def span_report(self) -> str:
+        lines = [f'Every span over {self.seconds:g}s, in milliseconds', 'span  count  p50  p95  max']
+        for name, samples in sorted(self.spans.items()):
+            ordered = sorted(samples)
+            p50 = ordered[len(ordered) // 2]
+            p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+            lines.append(f'{name}  {len(ordered)}  {p50 * 1000:.2f}  {p95 * 1000:.2f}  {ordered[-1] * 1000:.2f}')
+        return '\n'.join(lines)
+
+    @staticmethod
+    def _write(path: str, text: str) -> str:
+        with open(path, 'w') as f:
+            f.write(text + '\n')
+        return path
+
+
+class Profiler:
+    """
+    Sampled timing spans that are always on, plus at most one profiling session at a
+    time. Outside a session a span costs one random() call unless it is sampled; during
+    a session every span is also kept for the session's report.
+    """
+
+    def __init__(self, sample_rate: float = 0.1, directory: str = 'profiles', slow_callback: float = 0.05):
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.slow_callback = slow_callback
+        self.session: Optional[ProfilingSession] = None
+        self._histograms: Dict[str, Histogram] = {}
+
+    def _histogram(self, name: str) -> Histogram:
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            histogram = self._histograms[name] = metrics.histogram(
+                'span_seconds', 'Sampled durations of the verification spans', {'span': name}
+            )
+        return histogram
+
+    @contextmanager
+    def span(self, name: str):
+        """Times the block. Yields whether it was sampled, for child spans recorded by hand."""
+        session = self.session
+        sampled = random.random() < self.sample_rate
+        if session is None and not sampled:
+            yield False
+            return
+
+        started = time.perf_counter()
+        try:
+            yield sampled
+        finally:
+            self.record(name, time.perf_counter() - started, sampled)
+
+    def record(self, name: str, seconds: float, sampled: bool = False) -> None:
+        """Adds an already measured duration, to the session and, when sampled, to the metrics."""
+        if sampled:
+            self._histogram(name).observe(seconds)
+        if self.session is not None:
+            self.session.spans[name].append(seconds)
+
+    def wrap(self, func: Callable) -> Callable:
+        """Wraps a call bound for a worker thread so a CPU profiling session sees it."""
+        session = self.session
+        if session is None or session.cpu is None:
+            return func
+        return partial(session.run_profiled, func)
+
+    @property
+    def active(self) -> bool:
+        return self.session is not None
+
+    def start(self, kinds: Sequence[str] = PROFILE_KINDS, seconds: float = 30.0) -> ProfilingSession:
+        """Starts a session on the event loop thread. Raises RuntimeError if one is already running."""
+        if self.session is not None:
+            raise RuntimeError('A profiling session is already running')
+        if seconds <= 0:
+            raise ValueError('The profiling window must be positive')
+        unknown = set(kinds) - set(PROFILE_KINDS)
+        if unknown:
+            raise ValueError(f"Unknown profile kinds: {', '.join(sorted(unknown))}")
+
+        session = ProfilingSession(kinds, min(seconds, MAX_PROFILE_SECONDS), self.slow_callback)
+        session.start()
+        self.session = session
+        logger.info(f"Profiling {', '.join(session.kinds)} for {session.seconds:g}s")
+        return session
+
+    async def stop(self) -> List[str]:
+        """Ends the running session and writes its reports off the event loop."""
+        session = self.session
+        if session is None:
+            return []
+        self.session = None
+        session.stop()
+        paths = await asyncio.to_thread(session.write_reports, self.directory)
+        logger.info(f"Profiling reports written: {', '.join(paths)}")
+        return paths
+
+
+profiler = Profiler()
@@ -0,0 +1,169 @@
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, Optional, Tuple
+import logging
+from utils.logger import log_event
+from utils.metrics import metrics
+
+logger = logging.getLogger('captcha_bot')
+
+# Render latencies older than this no longer count towards the p95.
+LATENCY_WINDOW = 30.0
+
+
+@dataclass(frozen=True)
+class QualityTier:
+    """
+    How much work one challenge render may cost. `glyph_count` only applies when the
+    noise is drawn per render; with a noise bank every tier uses its overlays.
+    An `encoding_profile` of None keeps the configured IMAGE_PROFILE.
+    """
+    name: str
+    glyph_count: Optional[int] = None
+    encoding_profile: Optional[str] = None
+
+
+QUALITY_TIERS = (
+    QualityTier('full'),
+    QualityTier('reduced', glyph_count=60),
+    QualityTier('minimal', glyph_count=30, encoding_profile='png_fast'),
+)
+FULL_QUALITY = QUALITY_TIERS[0]
+
+
+class QualityController:
+    """
+    Picks the render quality tier from the render queue depth, the recent p95 render
+    latency and the event loop lag. Each signal is divided by its threshold and the
+    largest ratio is the pressure: at 1 the first degraded tier applies, at 2 the next.
+    Degrading happens at once; quality only comes back one tier at a time, after the
+    pressure has stayed below half of the current tier's threshold for `hold` seconds.
+    `on_change` is called with the previous and the new level after every switch.
+    """
+
+    def __init__(
+        self,
+        queue_depth: Callable[[], int],
+        loop_lag: Callable[[], float],
+        queue_threshold: int = 8,
+        latency_threshold: float = 0.25,
+        lag_threshold: float = 0.1,
+        hold: float = 15.0,
+        interval: float = 1.0,
+        enabled: bool = True,
+        on_change: Optional[Callable[[int, int], None]] = None,
+    ):
+        self.queue_depth = queue_depth
+        self.loop_lag = loop_lag
+        self.queue_threshold = queue_threshold
+        self.latency_threshold = latency_threshold
+        self.lag_threshold = lag_threshold
+        self.hold = hold
+        self.interval = interval
+        self.enabled = enabled
+        self.on_change = on_change
+        self.level = 0
+        self.pressure = 0.0
+        self.changes = 0
+        self.seconds: Dict[str, float] = {tier.name: 0.0 for tier in QUALITY_TIERS}
+        self._latencies: Deque[Tuple[float, float]] = deque()
+        self._entered_at = time.monotonic()
+        self._calm_since: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self._changes = {
+            tier.name: metrics.counter('quality_tier_changes_total', 'Switches into each render quality tier', {'tier': tier.name})
+            for tier in QUALITY_TIERS
+        }
+        metrics.gauge('quality_tier', 'Active render quality tier, 0 is full quality', callback=lambda: self.level)
+        for tier in QUALITY_TIERS:
+            metrics.gauge(
+                'quality_tier_seconds', 'Time spent in each render quality tier', {'tier': tier.name},
+                callback=lambda tier=tier: self.time_in(tier.name)
+            )
+
+    @property
+    def tier(self) -> QualityTier:
+        return QUALITY_TIERS[self.level]
+
+    def observe_render(self, seconds: float) -> None:
+        self._latencies.append((time.monotonic(), seconds))
+
+    def render_p95(self) -> float:
+        cutoff = time.monotonic() - LATENCY_WINDOW
+        while self._latencies and self._latencies[0][0] < cutoff:
+            self._latencies.popleft()
+        if not self._latencies:
+            return 0.0
+        ordered = sorted(seconds for _, seconds in self._latencies)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+    def time_in(self, name: str) -> float:
+        """Seconds spent in a tier, including the current stay."""
+        current = time.monotonic() - self._entered_at if name == self.tier.name else 0.0
+        return self.seconds[name] + current
+
+    def update(self) -> QualityTier:
+        """Re-evaluates the signals and switches tiers when needed."""
+        if not self.enabled:
+            return self.tier
+
+        queued = self.queue_depth()
+        p95 = self.render_p95()
+        lag = self.loop_lag()
+        self.pressure = max(queued / self.queue_threshold, p95 / self.latency_threshold, lag / self.lag_threshold)
+
+        now = time.monotonic()
+        wanted = min(len(QUALITY_TIERS) - 1, int(self.pressure))
+        if wanted > self.level:
+            self._calm_since = None
+            self._switch(wanted, now, queued=queued, p95_ms=round(p95 * 1000, 1), lag_ms=round(lag * 1000, 1))
+        elif self.level and self.pressure < self.level / 2:
+            if self._calm_since is None:
+                self._calm_since = now
+            elif now - self._calm_since >= self.hold:
+                self._calm_since = now
+                self._switch(self.level - 1, now, queued=queued, p95_ms=round(p95 * 1000, 1), lag_ms=round(lag * 1000, 1))
+        else:
+            self._calm_since = None
+        return self.tier
+
+    def _switch(self, level: int, now: float, **signals) -> None:
+        previous_level, previous = self.level, self.tier
+        stayed = now - self._entered_at
+        self.seconds[previous.name] += stayed
+        self._entered_at = now
+        self.level = level
+        self.changes += 1
+        self._changes[self.tier.name].inc()
+        log_event(
+            logger, 'QUALITY_TIER', logging.WARNING if level > 0 else logging.INFO,
+            tier=self.tier.name, previous=previous.name, pressure=round(self.pressure, 2),
+            stayed_seconds=round(stayed, 1), **signals
+        )
+        if self.on_change is not None:
+            self.on_change(previous_level, level)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            self.update()
+
+    def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            'tier': self.tier.name,
+            'pressure': round(self.pressure, 2),
+            'changes': self.changes,
+            'seconds': {name: round(self.time_in(name), 1) for name in self.seconds},
+        }
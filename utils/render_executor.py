@@ -0,0 +1,217 @@
+import asyncio
+import io
+import os
+import time
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+import logging
+from utils.image_generator import ImageGenerator
+from utils.noise_bank import NoiseBank
+from utils.metrics import Histogram, metrics
+from utils.quality import QualityTier
+from utils.profiling import profiler
+
+logger = logging.getLogger('captcha_bot')
+
+RENDER_MODES = ('inline', 'thread', 'process')
+IMAGE_SIZE_BUCKETS = tuple(1024 * kib for kib in (8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192))
+
+_worker_generator: Optional[ImageGenerator] = None
+
+
+def _init_worker(encoding_profile: str, noise_bank_path: Optional[str], pattern_atlas: Optional[str]) -> None:
+    """
+    Process pool initializer, loads the pattern set before the first job arrives.
+    The noise bank is only mapped here, the parent process builds and refreshes it.
+    """
+    global _worker_generator
+    noise_bank = NoiseBank(noise_bank_path) if noise_bank_path else None
+    _worker_generator = ImageGenerator(encoding_profile, noise_bank, pattern_atlas)
+
+
+def _warm_worker() -> int:
+    return os.getpid()
+
+
+def _render_in_worker(
+    pattern_file: str,
+    problem_text: str,
+    tier: Optional[QualityTier] = None,
+) -> Tuple[bytes, Dict[str, float]]:
+    timings = {}
+    buffer = _worker_generator.render_problem_image(pattern_file, problem_text, timings, tier)
+    return buffer.getvalue(), timings
+
+
+class RenderQueueFull(Exception):
+    """Raised when the render queue is at its configured depth."""
+    pass
+
+
+class RenderExecutor:
+    """Runs challenge rendering off the event loop, inline, on a thread pool or on a process pool."""
+
+    def __init__(
+        self,
+        image_generator: ImageGenerator,
+        mode: str = 'thread',
+        workers: int = 0,
+        queue_depth: int = 64,
+        timeout: float = 10.0,
+    ):
+        if mode not in RENDER_MODES:
+            raise ValueError(f"Unknown render mode: {mode}")
+
+        self.image_generator = image_generator
+        self.mode = mode
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_depth = queue_depth
+        self.timeout = timeout
+        self.pending = 0
+        self._executor: Optional[Executor] = None
+        self._render_seconds = metrics.histogram(
+            'render_seconds', 'Challenge render time including queueing', {'mode': mode}
+        )
+        self._stage_seconds = {
+            stage: metrics.histogram('render_stage_seconds', 'Time spent in each render stage', {'stage': stage})
+            for stage in ('compose', 'noise', 'encode')
+        }
+        self._encode_metrics: Dict[str, Tuple[Histogram, Histogram]] = {}
+        self._rejected = metrics.counter('render_rejected_total', 'Renders rejected because the queue was full')
+        metrics.gauge('render_queue_depth', 'Renders queued or running', callback=lambda: self.pending)
+
+        if mode == 'thread':
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='render')
+        elif mode == 'process':
+            self._executor = self._process_pool()
+
+    def _process_pool(self) -> ProcessPoolExecutor:
+        image_generator = self.image_generator
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(
+                image_generator.encoder.profile.name,
+                image_generator.noise_bank.path if image_generator.noise_bank else None,
+                image_generator.pattern_cache.atlas_path,
+            ),
+        )
+
+    async def start(self) -> None:
+        """Spawns every process worker up front so the first challenges don't pay for pattern loading."""
+        if self.mode != 'process':
+            return
+
+        loop = asyncio.get_running_loop()
+        pids = await asyncio.gather(*(
+            loop.run_in_executor(self._executor, _warm_worker)
+            for _ in range(self.workers)
+        ))
+        logger.info(f'Render pool ready with {len(set(pids))} worker processes')
+
+    async def recycle(self) -> None:
+        """
+        Replaces the process workers so they load the current pattern set. Jobs already
+        submitted finish on the old workers, new jobs go to the new ones.
+        """
+        if self.mode != 'process' or self._executor is None:
+            return
+
+        previous, self._executor = self._executor, self._process_pool()
+        previous.shutdown(wait=False)
+        await self.start()
+
+    def _job_done(self, _future) -> None:
+        self.pending -= 1
+
+    async def render(self, pattern_file: str, problem_text: str, tier: Optional[QualityTier] = None) -> io.BytesIO:
+        """
+        Renders a challenge image, at full quality unless a tier is given.
+        Raises RenderQueueFull when too many jobs are queued and asyncio.TimeoutError
+        when the job does not finish within the configured timeout.
+        """
+        with profiler.span('render') as sampled:
+            buffer, timings = await self._render(pattern_file, problem_text, tier)
+        for stage, seconds in timings.items():
+            profiler.record(f'render.{stage}', seconds, sampled)
+        return buffer
+
+    async def _render(
+        self,
+        pattern_file: str,
+        problem_text: str,
+        tier: Optional[QualityTier],
+    ) -> Tuple[io.BytesIO, Dict[str, float]]:
+        started = time.perf_counter()
+        timings: Dict[str, float] = {}
+
+        if self._executor is None:
+            buffer = self.image_generator.render_problem_image(pattern_file, problem_text, timings, tier)
+        else:
+            if self.pending >= self.queue_depth:
+                self._rejected.inc()
+                raise RenderQueueFull(f"{self.pending} renders already queued")
+
+            loop = asyncio.get_running_loop()
+            if self.mode == 'process':
+                future = loop.run_in_executor(self._executor, _render_in_worker, pattern_file, problem_text, tier)
+            else:
+                future = loop.run_in_executor(
+                    self._executor, profiler.wrap(self.image_generator.render_problem_image),
+                    pattern_file, problem_text, timings, tier
+                )
+
+            # The job keeps its slot until it actually finishes, even if the caller times out.
+            self.pending += 1
+            future.add_done_callback(self._job_done)
+
+            result = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+            if isinstance(result, tuple):
+                data, timings = result
+                buffer = io.BytesIO(data)
+            else:
+                buffer = result
+
+        self._render_seconds.observe(time.perf_counter() - started)
+        for stage, seconds in timings.items():
+            self._stage_seconds[stage].observe(seconds)
+        self._observe_encode(tier, timings, buffer.getbuffer().nbytes)
+        return buffer, timings
+
+    def _encode_histograms(self, profile: str) -> Tuple[Histogram, Histogram]:
+        histograms = self._encode_metrics.get(profile)
+        if histograms is None:
+            labels = {'profile': profile}
+            histograms = self._encode_metrics[profile] = (
+                metrics.histogram('encode_seconds', 'Challenge image encode time per profile', labels),
+                metrics.histogram(
+                    'encoded_bytes', 'Challenge image size per encoding profile', labels, buckets=IMAGE_SIZE_BUCKETS
+                ),
+            )
+        return histograms
+
+    def _observe_encode(self, tier: Optional[QualityTier], timings: Dict[str, float], size: int) -> None:
+        """Recorded here rather than in the encoder, which runs in a worker process in process mode."""
+        profile = (tier and tier.encoding_profile) or self.image_generator.encoder.profile.name
+        seconds, sizes = self._encode_histograms(profile)
+        if 'encode' in timings:
+            seconds.observe(timings['encode'])
+        sizes.observe(size)
+
+    def encoding_stats(self) -> Dict[str, dict]:
+        """Mean encode time and size per profile, across every render mode."""
+        return {
+            profile: {
+                'count': sizes.count,
+                'mean_encode_ms': round(seconds.sum / seconds.count * 1000, 2) if seconds.count else 0.0,
+                'mean_bytes': round(sizes.sum / sizes.count) if sizes.count else 0,
+            }
+            for profile, (seconds, sizes) in self._encode_metrics.items()
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
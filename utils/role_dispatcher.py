@@ -0,0 +1,171 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import discord
+import logging
+from utils.metrics import metrics
+from utils.logger import log_event
+
+logger = logging.getLogger('captcha_bot')
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second with bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+@dataclass(slots=True)
+class RoleGrant:
+    member: discord.Member
+    role: discord.Role
+    enqueued_at: float
+    on_failure: Optional[Callable[[], Awaitable[None]]] = None
+
+
+class RoleGrantDispatcher:
+    """
+    Grants roles in the background, paced to stay under the member-role route limit.
+    Repeated grants for a member that is already queued are dropped, and transient
+    failures are retried with exponential backoff. A grant that still fails runs its
+    `on_failure` callback, so the member who was told they passed hears about it.
+    """
+
+    def __init__(self, rate: float = 5.0, burst: int = 10, workers: int = 4, max_retries: int = 5):
+        self.bucket = TokenBucket(rate, burst)
+        self.workers = workers
+        self.max_retries = max_retries
+        self.granted = 0
+        self.failed = 0
+        self.deduplicated = 0
+        self.notified = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._pending: Dict[Tuple[int, int, int], RoleGrant] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._latency = metrics.histogram('role_grant_seconds', 'Time from queueing a role grant to completion')
+        self._outcomes = {
+            outcome: metrics.counter('role_grants_total', 'Role grants by outcome', {'outcome': outcome})
+            for outcome in ('granted', 'failed', 'deduplicated')
+        }
+        self._notices = metrics.counter(
+            'role_grant_failure_notices_total', 'Members told that their role grant failed'
+        )
+        metrics.gauge('role_grant_queue_depth', 'Role grants waiting or in progress', callback=lambda: self.queue_depth)
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    def grant(
+        self,
+        member: discord.Member,
+        role: discord.Role,
+        on_failure: Optional[Callable[[], Awaitable[None]]] = None,
+    ) -> bool:
+        """Queues a role grant. Returns False when the same grant is already queued."""
+        key = (role.guild.id, member.id, role.id)
+        if key in self._pending:
+            self.deduplicated += 1
+            self._outcomes['deduplicated'].inc()
+            return False
+
+        self._pending[key] = RoleGrant(member, role, time.monotonic(), on_failure)
+        self._queue.put_nowait(key)
+        return True
+
+    async def _apply(self, grant: RoleGrant) -> bool:
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            try:
+                await grant.member.add_roles(grant.role, reason='Passed verification')
+                return True
+            except (discord.Forbidden, discord.NotFound) as e:
+                log_event(logger, 'ROLE_GRANT_FAILED', logging.ERROR, user=grant.member, user_id=grant.member.id, error=e)
+                return False
+            except discord.HTTPException as e:
+                if e.status != 429 and e.status < 500:
+                    log_event(logger, 'ROLE_GRANT_FAILED', logging.ERROR, user=grant.member, user_id=grant.member.id, error=e)
+                    return False
+                backoff = min(2 ** attempt, 30)
+                logger.warning('Role grant for %s failed with %s, retrying in %ss', grant.member.id, e.status, backoff)
+                await asyncio.sleep(backoff)
+
+        log_event(
+            logger, 'ROLE_GRANT_FAILED', logging.ERROR,
+            user=grant.member, user_id=grant.member.id, error='retries exhausted'
+        )
+        return False
+
+    async def _worker(self) -> None:
+        while True:
+            key = await self._queue.get()
+            grant = self._pending[key]
+            try:
+                success = await self._apply(grant)
+            except Exception as e:
+                logger.error('Error granting role to %s: %s', grant.member.id, e)
+                success = False
+            finally:
+                self._pending.pop(key, None)
+                self._queue.task_done()
+
+            if success:
+                latency = time.monotonic() - grant.enqueued_at
+                self.granted += 1
+                self.total_latency += latency
+                self.max_latency = max(self.max_latency, latency)
+                self._latency.observe(latency)
+                self._outcomes['granted'].inc()
+            else:
+                self.failed += 1
+                self._outcomes['failed'].inc()
+                await self._notify(grant)
+
+    async def _notify(self, grant: RoleGrant) -> None:
+        if grant.on_failure is None:
+            return
+        try:
+            await grant.on_failure()
+        except Exception as e:
+            logger.error('Could not tell %s that their role grant failed: %s', grant.member.id, e)
+            return
+        self.notified += 1
+        self._notices.inc()
+
+    def start(self) -> None:
+        if not self._tasks:
+            loop = asyncio.get_running_loop()
+            self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def stats(self) -> dict:
+        return {
+            'queue_depth': self.queue_depth,
+            'granted': self.granted,
+            'failed': self.failed,
+            'deduplicated': self.deduplicated,
+            'notified': self.notified,
+            'mean_latency_ms': self.total_latency / self.granted * 1000 if self.granted else 0.0,
+            'max_latency_ms': self.max_latency * 1000,
+        }
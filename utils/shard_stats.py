@@ -0,0 +1,92 @@
+import asyncio
+import math
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+import discord
+import logging
+
+logger = logging.getLogger('captcha_bot')
+
+
+@dataclass(slots=True)
+class ShardCounters:
+    interactions: int = 0
+    member_joins: int = 0
+    delivery_seconds: float = 0.0
+    max_delivery_seconds: float = 0.0
+    window_started: float = field(default_factory=time.monotonic)
+    window_events: int = 0
+
+
+class ShardStats:
+    """
+    Per-shard event throughput and gateway delivery latency.
+    Delivery latency is the time between Discord creating an interaction and this
+    process dispatching it, which grows when a shard or the event loop falls behind.
+    """
+
+    def __init__(self, bot, log_interval: float = 60.0):
+        self.bot = bot
+        self.log_interval = log_interval
+        self.shards: Dict[int, ShardCounters] = defaultdict(ShardCounters)
+        self._task: Optional[asyncio.Task] = None
+
+    def record_interaction(self, interaction: discord.Interaction) -> None:
+        shard_id = interaction.guild.shard_id if interaction.guild else 0
+        counters = self.shards[shard_id]
+        delay = max(0.0, time.time() - interaction.created_at.timestamp())
+        counters.interactions += 1
+        counters.window_events += 1
+        counters.delivery_seconds += delay
+        counters.max_delivery_seconds = max(counters.max_delivery_seconds, delay)
+
+    def record_member_join(self, member: discord.Member) -> None:
+        counters = self.shards[member.guild.shard_id]
+        counters.member_joins += 1
+        counters.window_events += 1
+
+    def snapshot(self) -> Dict[int, dict]:
+        """Per-shard totals plus the event rate since the last snapshot."""
+        now = time.monotonic()
+        latencies = dict(getattr(self.bot, 'latencies', []))
+        result = {}
+        for shard_id in sorted(set(self.shards) | set(latencies)):
+            counters = self.shards[shard_id]
+            elapsed = max(now - counters.window_started, 1e-9)
+            heartbeat = latencies.get(shard_id, math.nan)
+            result[shard_id] = {
+                'interactions': counters.interactions,
+                'member_joins': counters.member_joins,
+                'events_per_sec': counters.window_events / elapsed,
+                'mean_delivery_ms': (
+                    counters.delivery_seconds / counters.interactions * 1000 if counters.interactions else 0.0
+                ),
+                'max_delivery_ms': counters.max_delivery_seconds * 1000,
+                'heartbeat_ms': heartbeat * 1000 if not math.isnan(heartbeat) else None,
+            }
+            counters.window_started = now
+            counters.window_events = 0
+            counters.max_delivery_seconds = 0.0
+        return result
+
+    async def _log_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.log_interval)
+            for shard_id, stats in self.snapshot().items():
+                heartbeat = f"{stats['heartbeat_ms']:.0f} ms" if stats['heartbeat_ms'] is not None else 'n/a'
+                logger.info(
+                    f"SHARD_STATS: shard {shard_id} - {stats['events_per_sec']:.2f} events/s, "
+                    f"delivery {stats['mean_delivery_ms']:.0f} ms avg / {stats['max_delivery_ms']:.0f} ms max, "
+                    f"heartbeat {heartbeat}"
+                )
+
+    def start(self) -> None:
+        if self._task is None and self.log_interval > 0:
+            self._task = asyncio.get_running_loop().create_task(self._log_loop())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,212 @@
+import asyncio
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import logging
+from utils.models import PendingKey, VerificationData
+from utils.pending_store import PendingVerificationStore
+
+logger = logging.getLogger('captcha_bot')
+
+
+class StateBackend(ABC):
+    """
+    Where pending verifications live, one per member of a guild. Every method is a
+    coroutine so a networked backend can be added without touching the views.
+    """
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    @abstractmethod
+    async def get(self, guild_id: int, user_id: int) -> Optional[VerificationData]:
+        ...
+
+    @abstractmethod
+    async def expires_at(self, guild_id: int, user_id: int) -> Optional[float]:
+        """Unix timestamp at which the member's challenge expires, or None if there is none."""
+        ...
+
+    @abstractmethod
+    async def put(self, guild_id: int, user_id: int, data: VerificationData) -> None:
+        """Stores a challenge; writing back the same challenge object keeps its deadline."""
+        ...
+
+    @abstractmethod
+    async def delete(self, guild_id: int, user_id: int) -> None:
+        ...
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    def stats(self) -> dict:
+        return {}
+
+
+class MemoryStateBackend(StateBackend):
+    """Process-local state, lost on restart."""
+
+    def __init__(self, store: PendingVerificationStore):
+        self.store = store
+
+    async def get(self, guild_id: int, user_id: int) -> Optional[VerificationData]:
+        return self.store.get((guild_id, user_id))
+
+    async def expires_at(self, guild_id: int, user_id: int) -> Optional[float]:
+        return self.store.expires_at((guild_id, user_id))
+
+    async def put(self, guild_id: int, user_id: int, data: VerificationData) -> None:
+        self.store[guild_id, user_id] = data
+
+    async def delete(self, guild_id: int, user_id: int) -> None:
+        self.store.pop((guild_id, user_id), None)
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def stats(self) -> dict:
+        return self.store.stats()
+
+
+Row = Tuple[int, int, int, str, str, int, float]
+
+
+class SQLiteStateBackend(MemoryStateBackend):
+    """
+    Durable state in a SQLite file. Reads are served from the in-memory store and
+    writes are coalesced per member and flushed in batches on a dedicated thread, so
+    interactions never wait on disk. In-flight challenges are reloaded on start.
+    """
+
+    def __init__(self, store: PendingVerificationStore, path: str, flush_interval: float = 0.5):
+        super().__init__(store)
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flushed = 0
+        self._dirty: Dict[PendingKey, Optional[Row]] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='state')
+        self._connection: Optional[sqlite3.Connection] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _run(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _open(self) -> List[Row]:
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        columns = [row[1] for row in self._connection.execute('PRAGMA table_info(pending_verifications)')]
+        if columns and 'guild_id' not in columns:
+            # Rows from before challenges were per guild can't be attributed to one.
+            logger.warning(f'Dropping pending verifications without a guild from {self.path}')
+            with self._connection:
+                self._connection.execute('DROP TABLE pending_verifications')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS pending_verifications ('
+            'guild_id INTEGER NOT NULL, user_id INTEGER NOT NULL, answer INTEGER NOT NULL, '
+            'pattern_file TEXT NOT NULL, polynomial TEXT NOT NULL, attempts INTEGER NOT NULL, '
+            'expires_at REAL NOT NULL, PRIMARY KEY (guild_id, user_id))'
+        )
+        now = time.time()
+        with self._connection:
+            self._connection.execute('DELETE FROM pending_verifications WHERE expires_at <= ?', (now,))
+        return self._connection.execute('SELECT * FROM pending_verifications').fetchall()
+
+    def _read(self, key: PendingKey) -> Optional[Row]:
+        return self._connection.execute(
+            'SELECT * FROM pending_verifications WHERE guild_id = ? AND user_id = ? AND expires_at > ?',
+            (*key, time.time())
+        ).fetchone()
+
+    def _write(self, batch: Dict[PendingKey, Optional[Row]]) -> None:
+        upserts = [row for row in batch.values() if row is not None]
+        deletes = [key for key, row in batch.items() if row is None]
+        with self._connection:
+            if upserts:
+                self._connection.executemany(
+                    'INSERT OR REPLACE INTO pending_verifications VALUES (?, ?, ?, ?, ?, ?, ?)', upserts
+                )
+            if deletes:
+                self._connection.executemany(
+                    'DELETE FROM pending_verifications WHERE guild_id = ? AND user_id = ?', deletes
+                )
+            self._connection.execute('DELETE FROM pending_verifications WHERE expires_at <= ?', (time.time(),))
+
+    def _load_row(self, row: Row) -> VerificationData:
+        guild_id, user_id, answer, pattern_file, polynomial, attempts, expires_at = row
+        data = VerificationData(
+            answer=answer, pattern_file=pattern_file, polynomial=polynomial, attempts=attempts, guild_id=guild_id
+        )
+        self.store.set((guild_id, user_id), data, expires_at=expires_at)
+        return data
+
+    async def start(self) -> None:
+        rows = await self._run(self._open)
+        for row in rows:
+            self._load_row(row)
+        logger.info(f'Resumed {len(rows)} pending verifications from {self.path}')
+        self._task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def flush(self) -> None:
+        if not self._dirty:
+            return
+        batch, self._dirty = self._dirty, {}
+        await self._run(self._write, batch)
+        self.flushed += len(batch)
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except sqlite3.Error as e:
+                logger.error(f'Error flushing verification state: {e}')
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._connection is not None:
+            await self.flush()
+            await self._run(self._connection.close)
+            self._connection = None
+        self._executor.shutdown(wait=True)
+
+    async def get(self, guild_id: int, user_id: int) -> Optional[VerificationData]:
+        key = (guild_id, user_id)
+        data = self.store.get(key)
+        if data is not None or key in self._dirty:
+            return data
+
+        # Another process sharing the file may have created the challenge.
+        row = await self._run(self._read, key)
+        return self._load_row(row) if row is not None else None
+
+    async def put(self, guild_id: int, user_id: int, data: VerificationData) -> None:
+        key = (guild_id, user_id)
+        self.store[key] = data
+        self._dirty[key] = (
+            guild_id, user_id, data.answer, data.pattern_file, data.polynomial, data.attempts,
+            self.store.expires_at(key)
+        )
+
+    async def delete(self, guild_id: int, user_id: int) -> None:
+        key = (guild_id, user_id)
+        self.store.pop(key, None)
+        self._dirty[key] = None
+
+    def stats(self) -> dict:
+        return dict(self.store.stats(), unflushed=len(self._dirty), flushed=self.flushed)
+
+
+def create_state_backend(config) -> StateBackend:
+    store = PendingVerificationStore(capacity=config.pending_capacity)
+    if config.state_backend == 'sqlite':
+        return SQLiteStateBackend(store, config.state_path, flush_interval=config.state_flush_interval)
+    return MemoryStateBackend(store)
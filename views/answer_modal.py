@@ -3,10 +3,19 @@ from discord.ui import Modal, TextInput
 import logging
 import os
 from utils.models import VerificationData
+from utils.metrics import metrics
+from utils.logger import log_event
+from utils.profiling import profiler
 import re
 
 logger = logging.getLogger('captcha_bot')
 
+submit_seconds = metrics.histogram('modal_submit_seconds', 'AnswerModal.on_submit handling time')
+
+
+def record_event(event: str) -> None:
+    metrics.counter('verification_events_total', 'Verification outcomes', {'event': event}).inc()
+
 class AnswerModal(Modal, title='Verification Answer'):
     answer = TextInput(
         label='Enter your answer',
@@ -24,40 +33,78 @@ class AnswerModal(Modal, title='Verification Answer'):
         pattern = r"^\d+'s verification code$"
         if re.match(pattern, input_text):
             user_id = input_text.split("'")[0]
-            logger.warning(f'BYPASS_ATTEMPT: User {interaction.user} (ID: {user_id})')
+            log_event(logger, 'BYPASS_ATTEMPT', logging.WARNING, user=interaction.user, claimed_id=user_id)
             if interaction.user.id != int(user_id):
-                logger.warning(f'BYPASS_FAILED: User {interaction.user} (ID: {interaction.user.id})')
+                log_event(logger, 'BYPASS_FAILED', logging.WARNING, user=interaction.user, user_id=interaction.user.id)
+                record_event('bypass_failed')
                 return False
-            logger.warning(f'BYPASS_SUCCESS: User {interaction.user} (ID: {interaction.user.id})')
+            log_event(logger, 'BYPASS_SUCCESS', logging.WARNING, user=interaction.user, user_id=interaction.user.id)
             return True
         return False
 
+    def grant_failed_notice(self, interaction: discord.Interaction, settings):
+        """Callback for the role dispatcher, run if the role can't be granted after all."""
+        async def notify():
+            embed = discord.Embed(
+                title="Error",
+                description="We couldn't give you the verified role. Please click Verify and try again.",
+                color=settings.error_color,
+            )
+            await interaction.followup.send(embed=embed, ephemeral=True)
+        return notify
+
     async def on_submit(self, interaction: discord.Interaction):
+        with submit_seconds.time(), profiler.span('answer_modal'):
+            await self.handle_submit(interaction)
+
+    async def handle_submit(self, interaction: discord.Interaction):
+        settings = await self.cog.guild_settings(interaction.guild_id)
+        if settings is None:
+            await interaction.response.send_message(embed=self.cog.not_configured_embed(), ephemeral=True)
+            return
+        if interaction.guild_id != self.verification_data.guild_id:
+            # A challenge only verifies its member in the guild, and at the difficulty, it was issued for.
+            log_event(
+                logger, 'VERIFICATION_WRONG_GUILD', logging.WARNING, user=interaction.user, user_id=interaction.user.id,
+                guild_id=interaction.guild_id, challenge_guild_id=self.verification_data.guild_id
+            )
+            record_event('wrong_guild')
+            embed = discord.Embed(
+                title="Error",
+                description="This challenge belongs to another server. Please start over.",
+                color=settings.error_color,
+            )
+            await interaction.response.send_message(
+                embed=embed,
+                ephemeral=True
+            )
+            return
         try:
             input_text = self.answer.value.strip()
 
             if self.check_bypass_code(interaction, input_text):
-                role = interaction.guild.get_role(self.cog.bot.config.role_id)
+                role = interaction.guild.get_role(settings.role_id)
                 if role:
-                    await interaction.user.add_roles(role)
+                    self.cog.role_dispatcher.grant(interaction.user, role, self.grant_failed_notice(interaction, settings))
                     embed = discord.Embed(
                         title="Verification Completed",
                         description="You have successfully verified that you are not a bot.",
-                        color=self.cog.bot.config.success_color,
+                        color=settings.success_color,
                     )
                     await interaction.response.send_message(
                         embed=embed,
                         ephemeral=True
                     )
-                    logger.warning(f'BYPASS_SUCCESS: User {interaction.user} (ID: {interaction.user.id})')
-                    self.cog.bot.pending_verifications.pop(interaction.user.id, None)
+                    log_event(logger, 'BYPASS_SUCCESS', logging.WARNING, user=interaction.user, user_id=interaction.user.id)
+                    record_event('bypass_success')
+                    await self.cog.bot.pending_verifications.delete(interaction.guild_id, interaction.user.id)
                     return
                 else:
-                    logger.error(f'Role not found during bypass: {self.cog.bot.config.role_id}')
+                    logger.error('Role not found during bypass: %s', settings.role_id)
                     embed = discord.Embed(
                         title="Error",
                         description="An error occurred while verifying. Please contact an administrator.",
-                        color=self.cog.bot.config.error_color,
+                        color=settings.error_color,
                     )
                     await interaction.response.send_message(
                         embed=embed,
@@ -66,34 +113,35 @@ class AnswerModal(Modal, title='Verification Answer'):
                     return
 
             user_answer = int(input_text)
-            logger.info(
-                f'VERIFICATION_ATTEMPT: User {interaction.user} (ID: {interaction.user.id})\n'
-                f'  Given Answer: {user_answer}\n'
-                f'  Correct Answer: {self.verification_data.answer}\n'
-                f'  Pattern: {self.verification_data.pattern_file}'
+            log_event(
+                logger, 'VERIFICATION_ATTEMPT', user=interaction.user, user_id=interaction.user.id,
+                given=user_answer,
+                correct=self.verification_data.answer,
+                pattern=self.verification_data.pattern_file
             )
 
             if user_answer == self.verification_data.answer:
-                role = interaction.guild.get_role(self.cog.bot.config.role_id)
+                role = interaction.guild.get_role(settings.role_id)
                 if role:
-                    await interaction.user.add_roles(role)
+                    self.cog.role_dispatcher.grant(interaction.user, role, self.grant_failed_notice(interaction, settings))
                     embed = discord.Embed(
                         title="Verification Completed",
                         description="You have successfully verified that you are not a bot.",
-                        color=self.cog.bot.config.success_color,
+                        color=settings.success_color,
                     )
                     await interaction.response.send_message(
                         embed=embed,
                         ephemeral=True
                     )
-                    logger.info(f'VERIFICATION_SUCCESS: User {interaction.user} (ID: {interaction.user.id})')
-                    self.cog.bot.pending_verifications.pop(interaction.user.id, None)
+                    log_event(logger, 'VERIFICATION_SUCCESS', user=interaction.user, user_id=interaction.user.id)
+                    record_event('success')
+                    await self.cog.bot.pending_verifications.delete(interaction.guild_id, interaction.user.id)
                 else:
-                    logger.error(f'Role not found: {self.cog.bot.config.role_id}')
+                    logger.error('Role not found: %s', settings.role_id)
                     embed = discord.Embed(
                         title="Error",
                         description="An error occurred while verifying. Please contact an administrator.",
-                        color=self.cog.bot.config.error_color,
+                        color=settings.error_color,
                     )
                     await interaction.response.send_message(
                         embed=embed,
@@ -101,50 +149,53 @@ class AnswerModal(Modal, title='Verification Answer'):
                     )
             else:
                 self.verification_data.attempts += 1
-                self.cog.bot.pending_verifications[interaction.user.id] = self.verification_data
+                await self.cog.bot.pending_verifications.put(interaction.guild_id, interaction.user.id, self.verification_data)
 
                 if self.verification_data.attempts >= 3:
                     embed = discord.Embed(
                         title="Error",
                         description="Too many wrong attempts. Please try verifying again.",
-                        color=self.cog.bot.config.error_color,
+                        color=settings.error_color,
                     )
                     await interaction.response.send_message(
                         embed=embed,
                         ephemeral=True
                     )
-                    logger.info(f'VERIFICATION_FAILURE: User {interaction.user} (ID: {interaction.user.id}) - Too many attempts')
-                    self.cog.bot.pending_verifications.pop(interaction.user.id, None)
+                    log_event(logger, 'VERIFICATION_FAILURE', user=interaction.user, user_id=interaction.user.id, reason='too_many_attempts')
+                    record_event('failure')
+                    await self.cog.bot.pending_verifications.delete(interaction.guild_id, interaction.user.id)
                 else:
                     remaining = 3 - self.verification_data.attempts
                     embed = discord.Embed(
                         title="Error",
-                        description="Wrong answer! You have {remaining} attempts remaining.",
-                        color=self.cog.bot.config.error_color,
+                        description=f"Wrong answer! You have {remaining} attempts remaining.",
+                        color=settings.error_color,
                     )
                     await interaction.response.send_message(
                         embed=embed,
                         ephemeral=True
                     )
-                    logger.info(f'VERIFICATION_WRONG_ANSWER: User {interaction.user} (ID: {interaction.user.id}) - {remaining} attempts remaining')
+                    log_event(logger, 'VERIFICATION_WRONG_ANSWER', user=interaction.user, user_id=interaction.user.id, remaining=remaining)
+                    record_event('wrong_answer')
 
         except ValueError:
-            logger.info(f'VERIFICATION_INVALID_INPUT: User {interaction.user} (ID: {interaction.user.id}) - Input: {self.answer.value}')
+            log_event(logger, 'VERIFICATION_INVALID_INPUT', user=interaction.user, user_id=interaction.user.id, input=self.answer.value)
+            record_event('invalid_input')
             embed = discord.Embed(
                 title="Error",
                 description="Please enter a valid number!",
-                color=self.cog.bot.config.error_color,
+                color=settings.error_color,
             )
             await interaction.response.send_message(
                 embed=embed,
                 ephemeral=True
             )
         except Exception as e:
-            logger.error(f'Error in verification modal: {str(e)}')
+            logger.error('Error in verification modal: %s', e)
             embed = discord.Embed(
                 title="Error",
                 description="An error occurred. Please try again.",
-                color=self.cog.bot.config.error_color,
+                color=settings.error_color,
             )
             await interaction.response.send_message(
                 embed=embed,
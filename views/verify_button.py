@@ -5,9 +5,31 @@ import discord
 from discord.ui import Button, View
 import logging
 from views.answer_modal import AnswerModal
+from utils.render_executor import RenderQueueFull
+from utils.admission import Admission
+from utils.metrics import metrics
+from utils.logger import log_event
+from utils.profiling import profiler
+from utils.guild_config import GuildSettings
+from utils.models import CHALLENGE_LIFETIME
 
 logger = logging.getLogger('captcha_bot')
 
+upload_seconds = metrics.histogram('challenge_upload_seconds', 'Time to send the challenge image to Discord')
+started_total = metrics.counter('verification_events_total', 'Verification outcomes', {'event': 'started'})
+ack_seconds = {
+    path: metrics.histogram(
+        'interaction_ack_seconds', 'Time from a Verify click to its acknowledgement', {'path': path}
+    )
+    for path in ('direct', 'deferred')
+}
+
+
+def observe_ack(interaction: discord.Interaction, path: str) -> None:
+    """Records the time since Discord created the interaction, which includes gateway delivery."""
+    waited = (discord.utils.utcnow() - interaction.created_at).total_seconds()
+    ack_seconds[path].observe(max(0.0, waited))
+
 class PersistentView(View):
     def __init__(self, cog):
         super().__init__(timeout=None)
@@ -24,12 +46,34 @@ class VerifyButton(Button):
         )
         self.cog = cog
 
+    async def send_error(self, interaction: discord.Interaction, settings: GuildSettings, description: str):
+        embed = discord.Embed(
+            title="Error",
+            description=description,
+            color=settings.error_color
+        )
+        if interaction.response.is_done():
+            await interaction.edit_original_response(embed=embed)
+            return
+        await interaction.response.send_message(
+            embed=embed,
+            ephemeral=True
+        )
+
     async def callback(self, interaction: discord.Interaction):
-        if interaction.user.get_role(self.cog.bot.config.role_id):
+        with profiler.span('verify_button'):
+            await self.handle_click(interaction)
+
+    async def handle_click(self, interaction: discord.Interaction):
+        settings = await self.cog.guild_settings(interaction.guild_id)
+        if settings is None:
+            await interaction.response.send_message(embed=self.cog.not_configured_embed(), ephemeral=True)
+            return
+        if interaction.user.get_role(settings.role_id):
             embed = discord.Embed(
                 title="Error",
                 description="You are already verified.",
-                color=self.cog.bot.config.error_color
+                color=settings.error_color
             )
             await interaction.response.send_message(
                 embed=embed,
@@ -37,81 +81,166 @@ class VerifyButton(Button):
             )
             return
 
-        result = await self.cog.generate_verification()
+        admission = await self.cog.admit(interaction.guild_id, interaction.user.id, settings.difficulty)
+        if admission in (Admission.REUSED, Admission.REMINDED):
+            # Inline renders run on the event loop, which a repeat click must not stall.
+            rerender = admission is Admission.REUSED and self.cog.render_executor.mode != 'inline'
+            await self.resend_challenge(interaction, settings, rerender)
+            return
+        if admission is Admission.THROTTLED:
+            await self.send_error(interaction, settings, "Please wait a few seconds before requesting a new challenge.")
+            return
+        if admission is Admission.SHED:
+            await self.send_error(interaction, settings, "Verification is busy right now. Please try again shortly.")
+            return
+
+        # A pooled challenge is sent straight away. A render may outlast the three second
+        # response window, so the interaction is acknowledged first and edited afterwards.
+        deferred = not self.cog.has_ready_challenge(settings.difficulty)
+        if deferred:
+            await interaction.response.defer(ephemeral=True, thinking=True)
+            observe_ack(interaction, 'deferred')
+
+        try:
+            result = await self.cog.generate_verification(settings.difficulty)
+        except (RenderQueueFull, asyncio.TimeoutError):
+            await self.send_error(interaction, settings, "Verification is busy right now. Please try again shortly.")
+            return
+        except Exception:
+            # Already logged by generate_verification, but a deferred response would otherwise spin forever.
+            await self.send_error(interaction, settings, "Something went wrong while creating your challenge. Please try again.")
+            return
         verification_data = result['verification']
+        verification_data.guild_id = interaction.guild_id
 
-        logger.info(
-            f'VERIFICATION_STARTED: User {interaction.user} (ID: {interaction.user.id})\n'
-            f'  Pattern: {verification_data.pattern_file}\n'
-            f'  Answer: {verification_data.answer}'
+        log_event(
+            logger, 'VERIFICATION_STARTED', user=interaction.user, user_id=interaction.user.id,
+            pattern=verification_data.pattern_file,
+            answer=verification_data.answer
         )
 
-        self.cog.bot.pending_verifications[interaction.user.id] = verification_data
+        await self.cog.bot.pending_verifications.put(interaction.guild_id, interaction.user.id, verification_data)
 
         embed = discord.Embed(
             title="Verification Challenge",
-            description=f"Please solve the mathematical problem below. The captcha challenge expires <t:{int(time.time() + 10 * 60)}:R>",
-            color=self.cog.bot.config.success_color
+            description=f"Please solve the mathematical problem below. The captcha challenge expires <t:{int(time.time() + CHALLENGE_LIFETIME)}:R>",
+            color=settings.success_color
         )
         embed.add_field(
             name="Instructions",
             value="1. Look at the pattern image\n2. Solve the mathematical equation\n3. Click 'Submit Answer' and enter your solution"
         )
 
-        verify_view = View(timeout=600)
-        submit_button = Button(
-            label="Submit Answer",
-            style=discord.ButtonStyle.green,
-            custom_id=f"submit_answer_{interaction.user.id}"
-        )
+        file = discord.File(result['image'], filename=result['filename'])
+        embed.set_image(url=f"attachment://{result['filename']}")
 
-        async def submit_callback(submit_interaction: discord.Interaction):
-            if submit_interaction.user.id != interaction.user.id:
-                embed = discord.Embed(
-                    title="Error",
-                    description="This is not your verification challenge!",
-                    color=self.cog.bot.config.error_color
-                )
-                await submit_interaction.response.send_message(
+        with upload_seconds.time():
+            if deferred:
+                await interaction.edit_original_response(
                     embed=embed,
-                    ephemeral=True
+                    attachments=[file],
+                    view=self.cog.challenge_view
                 )
-                return
-
-            verification = self.cog.bot.pending_verifications.get(submit_interaction.user.id)
-            if verification:
-                modal = AnswerModal(self.cog, verification)
-                await submit_interaction.response.send_modal(modal)
             else:
-                embed = discord.Embed(
-                    title="Error",
-                    description="Verification expired. Please start over.",
-                    color=self.cog.bot.config.error_color
-                )
-                await submit_interaction.response.send_message(
+                await interaction.response.send_message(
                     embed=embed,
+                    file=file,
+                    view=self.cog.challenge_view,
                     ephemeral=True
                 )
+                observe_ack(interaction, 'direct')
+        started_total.inc()
 
-        submit_button.callback = submit_callback
-        verify_view.add_item(submit_button)
+        self.cog.bot.expiry_scheduler.schedule(interaction, self.cog.expired_view, CHALLENGE_LIFETIME)
 
-        file = discord.File(result['image'], filename="captcha.png")
-        embed.set_image(url="attachment://captcha.png")
 
-        await interaction.response.send_message(
-            embed=embed,
-            file=file,
-            view=verify_view,
-            ephemeral=True
+    async def resend_challenge(self, interaction: discord.Interaction, settings: GuildSettings, rerender: bool):
+        """
+        Points a user back at their pending challenge. With `rerender` the image is rendered
+        again from the stored problem, since the original ephemeral message may have been
+        dismissed; otherwise, or when the render pipeline is busy, only a reminder is sent.
+        Only the re-rendered message is disabled on expiry, a reminder schedules nothing.
+        """
+        expires_at = await self.cog.bot.pending_verifications.expires_at(interaction.guild_id, interaction.user.id)
+        verification = await self.cog.bot.pending_verifications.get(interaction.guild_id, interaction.user.id)
+        embed = discord.Embed(
+            title="Verification In Progress",
+            description=f"You already have an active challenge that expires <t:{int(expires_at or time.time())}:R>. "
+                        "Solve it and click **Submit Answer** to enter your solution.",
+            color=settings.success_color
         )
 
-        await asyncio.sleep(60 * 10)
-        submit_button.disabled = True
-        await interaction.edit_original_response(
-            embed=embed,
-            view=verify_view,
+        if not rerender or verification is None:
+            await interaction.response.send_message(embed=embed, view=self.cog.challenge_view, ephemeral=True)
+            observe_ack(interaction, 'direct')
+            return
+
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        observe_ack(interaction, 'deferred')
+        attachments = []
+        try:
+            image, filename = await self.cog.rerender_verification(verification)
+        except (RenderQueueFull, asyncio.TimeoutError):
+            pass
+        else:
+            attachments.append(discord.File(image, filename=filename))
+            embed.set_image(url=f"attachment://{filename}")
+
+        with upload_seconds.time():
+            await interaction.edit_original_response(
+                embed=embed,
+                attachments=attachments,
+                view=self.cog.challenge_view
+            )
+        if attachments and expires_at is not None:
+            self.cog.bot.expiry_scheduler.schedule(
+                interaction, self.cog.expired_view, max(0.0, expires_at - time.time())
+            )
+
+
+class SubmitAnswerView(View):
+    def __init__(self, cog, disabled: bool = False):
+        super().__init__(timeout=None)
+        self.add_item(SubmitAnswerButton(cog, disabled=disabled))
+
+    @classmethod
+    def detached(cls, cog, disabled: bool = False) -> 'SubmitAnswerView':
+        """
+        A stopped copy to attach to challenge messages. discord.py never stores finished
+        views, so clicks are dispatched through the persistent instance registered at startup.
+        """
+        view = cls(cog, disabled=disabled)
+        view.stop()
+        return view
+
+
+class SubmitAnswerButton(Button):
+    def __init__(self, cog, disabled: bool = False):
+        super().__init__(
+            label="Submit Answer",
+            style=discord.ButtonStyle.green,
+            custom_id="submit_answer",
+            disabled=disabled
         )
+        self.cog = cog
+
+    async def callback(self, interaction: discord.Interaction):
+        # Challenge messages are ephemeral, so only their owner can click this button.
+        verification = await self.cog.bot.pending_verifications.get(interaction.guild_id, interaction.user.id)
+        if verification:
+            modal = AnswerModal(self.cog, verification)
+            await interaction.response.send_modal(modal)
+        else:
+            settings = await self.cog.display_settings(interaction.guild_id)
+            embed = discord.Embed(
+                title="Error",
+                description="Verification expired. Please start over.",
+                color=settings.error_color
+            )
+            await interaction.response.send_message(
+                embed=embed,
+                ephemeral=True
+            )
 
 
 class VerifyHelpButton(Button):
@@ -124,10 +253,11 @@ class VerifyHelpButton(Button):
         self.cog = cog
 
     async def callback(self, interaction: discord.Interaction):
+        settings = await self.cog.display_settings(interaction.guild_id)
         embed = discord.Embed(
             title="Help",
             description="See the instructions for the captcha and a helpful resource to assist you in completing it.",
-            color=self.cog.bot.config.success_color
+            color=settings.success_color
         )
         embed.add_field(
             name="Instructions",